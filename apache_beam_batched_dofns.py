@@ -0,0 +1,196 @@
+"""Batched (Arrow) DoFns for the Criteo Beam preprocessing pipelines.
+
+Batched versions of FillMissing, NegsToZeroLog, HexToIntModRange and
+PreprocessDict from the apache_beam_google_cloud_* pipelines. They implement
+Beam's process_batch on pyarrow batches, so each transform runs once per batch
+with numpy/pyarrow.compute kernels instead of splitting, parsing and joining
+strings per element.
+
+ReadFromParquet(as_rows=True) already emits pyarrow.Table batches of Beam
+rows, which reach these DoFns without being exploded into elements. Text
+input (ReadFromText) is batched by Beam into pyarrow string arrays and turned
+into a table by ParseDelimitedLines. ToDelimitedLines turns a table back into
+the delimited text lines expected by the TFXIO CSV source.
+
+Missing values (nulls, empty fields) are 0, as in FillMissing.
+BatchedPreprocessDict also sets unparsable values to 0 and counts them in
+the preprocessing/replaced_values counter.
+
+This module has to be importable on the workers (see py_modules in setup.py).
+"""
+
+from typing import Iterator
+
+import apache_beam as beam
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from apache_beam.typehints.row_type import RowTypeConstraint
+
+from data_utils_parquet_common import sparse_column_to_int
+
+_NUMBER_PATTERN = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+_HEX_PATTERN = r"^[0-9a-fA-F]{1,16}$"
+
+
+def _is_string(array):
+  return pa.types.is_string(array.type) or pa.types.is_large_string(array.type)
+
+
+def fill_missing(array, valid_pattern=None):
+  """Replaces nulls and empty strings (and, for strings, values not matching valid_pattern) with 0."""
+  if not _is_string(array):
+    return array.fill_null(0)
+  array = array.fill_null("")
+  valid = pc.match_substring_regex(array, valid_pattern or r".")
+  return pc.if_else(valid, array, pa.scalar("0", array.type))
+
+
+def count_invalid(array, valid_pattern):
+  """Number of present (non-null, non-empty) strings that do not match valid_pattern."""
+  if not _is_string(array):
+    return 0
+  present = pc.and_(pc.is_valid(array), pc.not_equal(array, ""))
+  invalid = pc.and_(present, pc.invert(pc.match_substring_regex(array, valid_pattern)))
+  return pc.sum(invalid).as_py() or 0
+
+
+def negs_to_zero_log(array):
+  """log(x + 1) of a numeric (or decimal string) column, negatives set to zero."""
+  if _is_string(array):
+    array = pc.cast(fill_missing(array), pa.float64())
+  # np.asarray: ChunkedArray.to_numpy takes no arguments on pyarrow 10
+  values = np.asarray(array.fill_null(0)).astype(np.float64)
+  return pa.array(np.log(np.maximum(values, 0) + 1))
+
+
+def hex_to_int_mod_range(array, max_vocab_size):
+  """int(x, 16) % max_vocab_size of a hex string (or integer) column, as int64."""
+  return pa.array(sparse_column_to_int(array, max_vocab_size))
+
+
+def _replace_columns(table, columns):
+  for name, array in columns.items():
+    table = table.set_column(table.schema.get_field_index(name), name, array)
+  return table
+
+
+def _row_type(input_element_type, overrides):
+  """Row type of input_element_type with the types of the fields in overrides replaced."""
+  if not isinstance(input_element_type, RowTypeConstraint):
+    # e.g. the NamedTuple generated by ReadFromParquet(as_rows=True)
+    input_element_type = RowTypeConstraint.from_user_type(input_element_type)
+  return RowTypeConstraint.from_fields(
+      [(name, overrides.get(name, typ)) for name, typ in input_element_type._fields])
+
+
+class ParseDelimitedLines(beam.DoFn):
+  """Splits a batch of delimited text lines into a table of string columns."""
+
+  def __init__(self, column_names, delimiter="\t"):
+    self.column_names = list(column_names)
+    self.delimiter = delimiter
+
+  def process_batch(self, batch: pa.Array) -> Iterator[pa.Table]:
+    fields = pc.split_pattern(batch, self.delimiter)
+    num_columns = len(self.column_names)
+    if len(batch) and not pc.all(pc.equal(pc.list_value_length(fields), num_columns)).as_py():
+      raise ValueError(f"Every line must have {num_columns} fields")
+    # All lines have num_columns fields: column i is every num_columns-th value
+    values = pc.list_flatten(fields)
+    yield pa.table({name: values.take(pa.array(np.arange(i, len(values), num_columns)))
+                    for i, name in enumerate(self.column_names)})
+
+  def infer_output_type(self, input_element_type):
+    return RowTypeConstraint.from_fields([(name, str) for name in self.column_names])
+
+
+class BatchedFillMissing(beam.DoFn):
+  """Fills missing (null or empty) values with zeros."""
+
+  def process_batch(self, batch: pa.Table) -> Iterator[pa.Table]:
+    yield pa.table([fill_missing(column) for column in batch.columns], names=batch.column_names)
+
+  def infer_output_type(self, input_element_type):
+    return input_element_type
+
+
+class BatchedNegsToZeroLog(beam.DoFn):
+  """For int features, sets negative values to zero and takes log(x+1)."""
+
+  def __init__(self, numeric_keys):
+    self.numeric_keys = list(numeric_keys)
+
+  def process_batch(self, batch: pa.Table) -> Iterator[pa.Table]:
+    yield _replace_columns(batch, {key: negs_to_zero_log(batch.column(key)) for key in self.numeric_keys})
+
+  def infer_output_type(self, input_element_type):
+    return _row_type(input_element_type, {key: float for key in self.numeric_keys})
+
+
+class BatchedHexToIntModRange(beam.DoFn):
+  """For categorical features, takes decimal value and mods with max value."""
+
+  def __init__(self, categorical_keys, max_vocab_size):
+    self.categorical_keys = list(categorical_keys)
+    self.max_vocab_size = max_vocab_size
+
+  def process_batch(self, batch: pa.Table) -> Iterator[pa.Table]:
+    yield _replace_columns(batch, {key: hex_to_int_mod_range(batch.column(key), self.max_vocab_size)
+                                   for key in self.categorical_keys})
+
+  def infer_output_type(self, input_element_type):
+    return _row_type(input_element_type, {key: int for key in self.categorical_keys})
+
+
+class BatchedPreprocessDict(beam.DoFn):
+  """NegsToZeroLog and HexToIntModRange in one step; unparsable values become 0.
+
+  As in PreprocessDict, categorical values are decimal strings (the FEATURE_SPEC
+  declares them as tf.string).
+  """
+
+  def __init__(self, numeric_keys, categorical_keys, max_vocab_size):
+    self.numeric_keys = list(numeric_keys)
+    self.categorical_keys = list(categorical_keys)
+    self.max_vocab_size = max_vocab_size
+    self.replaced_counter = beam.metrics.Metrics.counter("preprocessing", "replaced_values")
+
+  def process_batch(self, batch: pa.Table) -> Iterator[pa.Table]:
+    replaced = 0
+    columns = {}
+    for key in self.numeric_keys:
+      column = batch.column(key)
+      replaced += count_invalid(column, _NUMBER_PATTERN)
+      columns[key] = negs_to_zero_log(fill_missing(column, _NUMBER_PATTERN))
+    for key in self.categorical_keys:
+      column = batch.column(key)
+      replaced += count_invalid(column, _HEX_PATTERN)
+      ids = hex_to_int_mod_range(fill_missing(column, _HEX_PATTERN), self.max_vocab_size)
+      columns[key] = pc.cast(ids, pa.string())
+    if replaced:
+      self.replaced_counter.inc(replaced)
+    yield _replace_columns(batch, columns)
+
+  def infer_output_type(self, input_element_type):
+    return _row_type(input_element_type, {**{key: float for key in self.numeric_keys},
+                                          **{key: str for key in self.categorical_keys}})
+
+
+class ToDelimitedLines(beam.DoFn):
+  """Joins the columns of a batch into delimited text lines (bytes), missing values as 0."""
+
+  def __init__(self, column_names, delimiter="\t"):
+    self.column_names = list(column_names)
+    self.delimiter = delimiter
+
+  # The lines go to per-element consumers (TFXIO, WriteToText), so they are
+  # yielded as elements; they are still built for the whole batch at once.
+  @beam.DoFn.yields_elements
+  def process_batch(self, batch: pa.Table) -> Iterator[bytes]:
+    columns = [pc.cast(batch.column(name), pa.string()).fill_null("0") for name in self.column_names]
+    lines = pc.binary_join_element_wise(*columns, self.delimiter)
+    yield from pc.cast(lines, pa.binary()).to_pylist()
+
+  def infer_output_type(self, input_element_type):
+    return bytes
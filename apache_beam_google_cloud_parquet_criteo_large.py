@@ -35,7 +35,6 @@ import os
 from absl import logging
 
 import apache_beam as beam
-import numpy as np
 import tensorflow as tf, tf_keras
 import tensorflow_transform as tft
 import tensorflow_transform.beam as tft_beam
@@ -43,6 +42,10 @@ from tensorflow_transform.tf_metadata import dataset_metadata
 from tensorflow_transform.tf_metadata import schema_utils
 from tfx_bsl.public import tfxio
 
+from apache_beam_batched_dofns import (BatchedHexToIntModRange,
+                                       BatchedNegsToZeroLog,
+                                       ToDelimitedLines)
+
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -200,52 +203,6 @@ def compute_vocab_fn(inputs):
   return outputs
 
 
-class FillMissing(beam.DoFn):
-  """Fills missing elements with zero string value."""
-
-  def process(self, element):
-    elem_list = element.split(args.csv_delimeter)
-    out_list = []
-    for val in elem_list:
-      new_val = "0" if not val else val
-      out_list.append(new_val)
-    yield (args.csv_delimeter).join(out_list)
-
-
-class NegsToZeroLog(beam.DoFn):
-  """For int features, sets negative values to zero and takes log(x+1)."""
-
-  def process(self, element):
-    # elem_list = element.split(args.csv_delimeter)
-    out_list = []
-    # for i, val in enumerate(elem_list):
-    for i, key in enumerate([LABEL_KEY] + NUMERIC_FEATURE_KEYS + CATEGORICAL_FEATURE_KEYS):
-      val = element.get(key, "0")
-      if i > 0 and i <= NUM_NUMERIC_FEATURES:
-        new_val = "0" if int(val) < 0 else val
-        new_val = np.log(int(new_val) + 1)
-        new_val = str(new_val)
-      else:
-        new_val = str(val)
-      out_list.append(new_val)
-    yield (args.csv_delimeter).join(out_list)
-
-
-class HexToIntModRange(beam.DoFn):
-  """For categorical features, takes decimal value and mods with max value."""
-
-  def process(self, element):
-    elem_list = element.split(args.csv_delimeter)
-    out_list = []
-    for i, val in enumerate(elem_list):
-      if i > NUM_NUMERIC_FEATURES:
-        new_val = int(val, 16) % args.max_vocab_size
-      else:
-        new_val = val
-      out_list.append(str(new_val))
-    yield str.encode((args.csv_delimeter).join(out_list))
-
-
 def transform_data(data_path, output_path):
   """Preprocesses Criteo data.
 
@@ -270,7 +227,8 @@ def transform_data(data_path, output_path):
         "project": args.project,
         "save_main_session": True,
         "region": args.region,
-        # "setup_file": "./setup.py",
+        # Ships apache_beam_batched_dofns / data_utils_parquet_common (py_modules) to the workers
+        "setup_file": os.path.join(os.path.dirname(os.path.abspath(__file__)), "setup.py"),
         "machine_type": args.machine_type,  # Add this line
         "num_workers": args.num_workers,  # Add this line
         "sdk_container_image": args.sdk_container_image,
@@ -290,13 +248,17 @@ def transform_data(data_path, output_path):
           pipeline
         #   # Read in TSV data.
         #   | beam.io.ReadFromText(data_path, coder=beam.coders.StrUtf8Coder())
-          | 'ReadParquet' >> beam.io.ReadFromParquet(args.input_path, validate=False, as_rows=False)
-        #   # Fill in missing elements with the defaults (zeros).
-        #   | "FillMissing" >> beam.ParDo(FillMissing())
+          # Beam rows, delivered to the batched DoFns as pyarrow tables.
+          | 'ReadParquet' >> beam.io.ReadFromParquet(args.input_path, validate=False, as_rows=True)
           # For numerical features, set negatives to zero. Then take log(x+1).
-          | "NegsToZeroLog" >> beam.ParDo(NegsToZeroLog())
+          | "NegsToZeroLog" >> beam.ParDo(BatchedNegsToZeroLog(NUMERIC_FEATURE_KEYS))
           # For categorical features, mod the values with vocab size.
-          | "HexToIntModRange" >> beam.ParDo(HexToIntModRange()))
+          | "HexToIntModRange" >> beam.ParDo(
+              BatchedHexToIntModRange(CATEGORICAL_FEATURE_KEYS, args.max_vocab_size))
+          # Missing values are written as zeros.
+          | "ToDelimitedLines" >> beam.ParDo(ToDelimitedLines(
+              [LABEL_KEY] + NUMERIC_FEATURE_KEYS + CATEGORICAL_FEATURE_KEYS,
+              args.csv_delimeter)))
 
       # CSV reader: List the cols in order, as dataset schema is not ordered.
       ordered_columns = [LABEL_KEY
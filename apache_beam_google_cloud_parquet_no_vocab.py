@@ -1,11 +1,10 @@
 """
 Minimal working Apache Beam + TFT pipeline for Parquet input
-Using `as_rows=False` to emit dictionaries instead of Beam Rows.
+Using `as_rows=True`: Beam rows reach the batched DoFns as pyarrow tables.
 """
 
 import apache_beam as beam
 import apache_beam.transforms.util as beam_util
-import numpy as np
 import tensorflow_transform as tft
 import tensorflow_transform.beam as tft_beam
 from tensorflow_transform.tf_metadata import dataset_metadata, schema_utils
@@ -15,6 +14,10 @@ import os
 import datetime
 from absl import logging
 import time
+from typing import Iterator
+import pyarrow as pa
+
+from apache_beam_batched_dofns import BatchedPreprocessDict
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -122,30 +125,6 @@ def apply_vocab_fn(inputs):
         outputs[key] = tft.apply_vocabulary(inputs[key], vocab_path)
     return outputs
 
-class PreprocessDict(beam.DoFn):
-    def __init__(self):
-        self.skipped_counter = beam.metrics.Metrics.counter("preprocessing", "skipped_elements")
-
-    def process(self, element):
-        try: 
-            result = dict(element)
-            for key in NUMERIC_KEYS:
-                try:
-                    val = float(result.get(key, 0.0))
-                    result[key] = float(np.log(val + 1) if val >= 0 else 0.0)
-                except:
-                    result[key] = 0.0
-            for key in CATEGORICAL_KEYS:
-                val = result.get(key, "0")
-                try:
-                    result[key] = str(int(val, 16) % args.max_vocab_size)
-                except:
-                    result[key] = "0"
-            return [result]
-        except Exception as e:
-            logging.error(f"Error processing element: {element}, error: {e}")
-            return []
-
 def measure_time(description):
     """Create a DoFn that logs timestamps for measuring performance"""
     class MeasureTimeFn(beam.DoFn):
@@ -163,6 +142,16 @@ def measure_time(description):
                 elapsed = time.time() - self.start_time
                 logging.info(f"{self.description}: Processed {self.count} elements in {elapsed:.2f}s ({self.count/elapsed:.2f} elements/s)")
             yield element
+
+        # Batched input (Beam rows as pyarrow tables) is counted without exploding it
+        def process_batch(self, batch: pa.Table) -> Iterator[pa.Table]:
+            self.count += batch.num_rows
+            elapsed = time.time() - self.start_time
+            logging.info(f"{self.description}: Processed {self.count} elements in {elapsed:.2f}s ({self.count/elapsed:.2f} elements/s)")
+            yield batch
+
+        def infer_output_type(self, input_type):
+            return input_type
             
         def finish_bundle(self):
             elapsed = time.time() - self.start_time
@@ -180,7 +169,8 @@ def transform_data():
         "project": args.project,
         "save_main_session": True,
         "region": args.region,
-        # "setup_file": "./setup.py",
+        # Ships apache_beam_batched_dofns / data_utils_parquet_common (py_modules) to the workers
+        "setup_file": os.path.join(os.path.dirname(os.path.abspath(__file__)), "setup.py"),
         "machine_type": args.machine_type,  # Add this line
         "num_workers": args.num_workers,  # Add this line
         "sdk_container_image": args.sdk_container_image,
@@ -199,9 +189,9 @@ def transform_data():
         with tft_beam.Context(temp_dir=args.temp_dir):
             raw_data = (
                 p
-                | 'ReadParquet' >> beam.io.ReadFromParquet(args.input_path, validate=False, as_rows=False)
+                | 'ReadParquet' >> beam.io.ReadFromParquet(args.input_path, validate=False, as_rows=True)
                 | 'MeasureRead' >> beam.ParDo(measure_time("ReadParquet output"))
-                | 'PreprocessDict' >> beam.ParDo(PreprocessDict())  
+                | 'PreprocessDict' >> beam.ParDo(BatchedPreprocessDict(NUMERIC_KEYS, CATEGORICAL_KEYS, args.max_vocab_size))
             )
 
 
@@ -1,37 +1,140 @@
 import pyarrow.parquet as pq
 import os
+import json
 import argparse
+import threading
+import collections
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-def split_parquet(input_file, output_dir, num_shards=1024):
+
+def plan_shards(metadata, num_shards=1024, target_rows=None, target_bytes=None, balance="rows"):
+    """Row ranges [(start, end)] of the shards, from the footer only.
+
+    target_rows / target_bytes close a shard every N rows / bytes; otherwise the
+    input is cut into num_shards shards of equal rows (balance="rows", extra rows
+    go to the first shards) or equal estimated bytes (balance="bytes", each
+    row group's bytes spread evenly over its rows).
+    """
+    total_rows = metadata.num_rows
+    if target_rows:
+        cuts = list(range(0, total_rows, target_rows)) + [total_rows]
+    elif target_bytes or balance == "bytes":
+        rg_rows = np.array([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)], dtype=np.int64)
+        rg_bytes = np.array([metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups)], dtype=np.float64)
+        rg_start = np.concatenate([[0], np.cumsum(rg_rows)])
+        bytes_before = np.concatenate([[0.0], np.cumsum(rg_bytes)])
+        total_bytes = bytes_before[-1]
+        if not target_bytes:
+            target_bytes = total_bytes / num_shards
+        cuts = [0]
+        for boundary in np.arange(target_bytes, total_bytes, target_bytes):
+            # Row at which the cumulative byte estimate reaches boundary
+            rg = min(np.searchsorted(bytes_before, boundary, side="right") - 1, len(rg_rows) - 1)
+            row = rg_start[rg] + int((boundary - bytes_before[rg]) / max(rg_bytes[rg], 1.0) * rg_rows[rg])
+            if row > cuts[-1]:
+                cuts.append(int(row))
+        cuts.append(total_rows)
+    else:
+        rows_per_shard, remainder = divmod(total_rows, num_shards)
+        cuts = [0]
+        for i in range(num_shards):
+            cuts.append(cuts[-1] + rows_per_shard + (1 if i < remainder else 0))
+    return [(start, end) for start, end in zip(cuts[:-1], cuts[1:]) if end > start]
+
+
+def split_parquet(input_file, output_dir, num_shards=1024, target_rows=None, target_bytes=None, balance="rows",
+                  n_threads=8, max_inflight=4):
+    """Stream input_file into shards; only max_inflight row-group slices are held in memory.
+
+    Input row groups are read in order and sliced at shard boundaries; slices are
+    written by a thread pool (slices of one shard in order, different shards
+    concurrently). A manifest.json with each shard's row range is written last.
+    """
     # Ensure output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Read the full table from the input Parquet file
-    table = pq.read_table(input_file)
-    total_rows = table.num_rows
-    rows_per_shard = total_rows // num_shards
-    remainder = total_rows % num_shards
-
-    print(f"Total rows: {total_rows}")
-    print(f"Splitting into {num_shards} shards...")
-
-    start = 0
-    for i in range(num_shards):
-        end = start + rows_per_shard + (1 if i < remainder else 0)
-        shard = table.slice(start, end - start)
-        shard_path = os.path.join(output_dir, f"shard_{i:04d}.parquet")
-        pq.write_table(shard, shard_path)
-        print(f"Wrote {shard_path} with {shard.num_rows} rows")
-        start = end
+    os.makedirs(output_dir, exist_ok=True)
+
+    pf = pq.ParquetFile(input_file)
+    shards = plan_shards(pf.metadata, num_shards, target_rows, target_bytes, balance)
+    print(f"Total rows: {pf.metadata.num_rows}")
+    print(f"Splitting into {len(shards)} shards...")
+
+    paths = [os.path.join(output_dir, f"shard_{i:04d}.parquet") for i in range(len(shards))]
+    writers = [None] * len(shards)
+    last_task = [None] * len(shards)
+    slots = threading.BoundedSemaphore(max_inflight)
+
+    def write_slice(shard, table, previous, close):
+        try:
+            # Slices of one shard are chained so they are written in row order
+            if previous is not None:
+                previous.result()
+            if writers[shard] is None:
+                writers[shard] = pq.ParquetWriter(paths[shard], pf.schema_arrow)
+            if table is not None:
+                writers[shard].write_table(table)
+            if close:
+                writers[shard].close()
+        finally:
+            if table is not None:
+                slots.release()
+
+    # Closed shards are reported from this thread, in order, so log lines never interleave
+    closing = collections.deque()
+
+    def report_closed(wait=False):
+        while closing and (wait or closing[0][1].done()):
+            done, task = closing.popleft()
+            task.result()
+            print(f"Wrote {paths[done]} with {shards[done][1] - shards[done][0]} rows")
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        shard, row = 0, 0
+        for rg in range(pf.num_row_groups):
+            slots.acquire()
+            table = pf.read_row_group(rg)
+            slots.release()
+            offset = 0
+            while offset < table.num_rows:
+                end = min(offset + shards[shard][1] - row, table.num_rows)
+                close = row + (end - offset) == shards[shard][1]
+                slots.acquire()
+                last_task[shard] = executor.submit(write_slice, shard, table.slice(offset, end - offset),
+                                                   last_task[shard], close)
+                row += end - offset
+                offset = end
+                if close:
+                    closing.append((shard, last_task[shard]))
+                    shard += 1
+            report_closed()
+        for task in last_task:
+            if task is not None:
+                task.result()
+        report_closed(wait=True)
 
+    manifest = {
+        "input_file": input_file,
+        "num_rows": pf.metadata.num_rows,
+        "shards": [{"path": path, "row_start": start, "row_end": end, "num_rows": end - start,
+                    "bytes": os.path.getsize(path)}
+                   for path, (start, end) in zip(paths, shards)],
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
     print("Done.")
+    return manifest
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Split a local Parquet file into multiple shards.")
     parser.add_argument("--input_file", required=True, help="Path to the input Parquet file")
     parser.add_argument("--output_dir", required=True, help="Directory where shard files will be written")
     parser.add_argument("--num_shards", type=int, default=1024, help="Number of output shards (default: 1024)")
+    parser.add_argument("--target_rows", type=int, default=None, help="Close a shard every N rows (overrides --num_shards)")
+    parser.add_argument("--target_mb", type=float, default=None, help="Close a shard every N MB of data (overrides --num_shards)")
+    parser.add_argument("--balance", choices=["rows", "bytes"], default="rows", help="Equalize rows or bytes across --num_shards shards")
+    parser.add_argument("--n_threads", type=int, default=8, help="Threads writing shards concurrently")
+    parser.add_argument("--max_inflight", type=int, default=4, help="Row-group slices held in memory at once")
     args = parser.parse_args()
 
-    split_parquet(args.input_file, args.output_dir, args.num_shards)
+    split_parquet(args.input_file, args.output_dir, args.num_shards, args.target_rows,
+                  args.target_mb * 1024**2 if args.target_mb else None, args.balance, args.n_threads, args.max_inflight)
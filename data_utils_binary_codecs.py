@@ -0,0 +1,146 @@
+import time
+import numpy as np
+
+# Block compressors are optional: only needed when a column uses them
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# ----------------------------------------
+# Per-chunk codecs for the binary column container
+#
+# Every chunk is encoded on its own, so any chunk can be decoded without the
+# others. encode() returns (payload bytes, params) and params are stored in the
+# chunk's index entry; decode() only needs the payload, params, dtype and count.
+#
+# none       raw little-endian values
+# zstd, lz4  block compression of the raw values
+# bitpack    non-negative ints packed to `bits` bits (ceil(log2(modulus)) when known)
+# for        frame of reference: value - min, then bit-packed
+# delta      first value + zigzag-encoded differences, bit-packed
+# ----------------------------------------
+CODECS = ["none", "zstd", "lz4", "bitpack", "for", "delta"]
+INTEGER_CODECS = {"bitpack", "for", "delta"}
+
+
+def available_codecs(dtype):
+    codecs = ["none"]
+    if zstandard is not None:
+        codecs.append("zstd")
+    if lz4 is not None:
+        codecs.append("lz4")
+    if np.dtype(dtype).kind in "iu":
+        codecs += ["bitpack", "for", "delta"]
+    return codecs
+
+
+def bits_for_modulus(modulus):
+    return max(int(np.ceil(np.log2(modulus))), 1) if modulus > 1 else 1
+
+
+def _bit_width(max_value):
+    return max(int(max_value).bit_length(), 1)
+
+
+def pack_bits(values, bits):
+    """Pack non-negative integers (< 2**bits) into a little-endian bit stream."""
+    as_bytes = np.ascontiguousarray(values, dtype="<u8").view(np.uint8).reshape(-1, 8)
+    bit_matrix = np.unpackbits(as_bytes, axis=1, bitorder="little")[:, :bits]
+    return np.packbits(bit_matrix.reshape(-1), bitorder="little").tobytes()
+
+
+def unpack_bits(payload, bits, count):
+    bit_stream = np.unpackbits(np.frombuffer(payload, dtype=np.uint8), bitorder="little")[:count * bits]
+    bit_matrix = np.zeros((count, 64), dtype=np.uint8)
+    bit_matrix[:, :bits] = bit_stream.reshape(count, bits)
+    return np.packbits(bit_matrix, axis=1, bitorder="little").reshape(-1).view("<u8")
+
+
+def encode(values, codec, modulus=None):
+    values = np.ascontiguousarray(values)
+    if codec == "none":
+        return values.tobytes(), {}
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd codec requires the zstandard package")
+        return zstandard.ZstdCompressor(level=3).compress(values.tobytes()), {}
+    if codec == "lz4":
+        if lz4 is None:
+            raise ImportError("lz4 codec requires the lz4 package")
+        return lz4.frame.compress(values.tobytes()), {}
+    if values.dtype.kind not in "iu":
+        raise ValueError(f"{codec} codec only applies to integer columns")
+    if len(values) == 0:
+        return b"", {"bits": 1}
+    ints = values.astype(np.int64)
+    if codec == "bitpack":
+        if ints.min() < 0:
+            raise ValueError("bitpack codec needs non-negative values")
+        bits = bits_for_modulus(modulus) if modulus else _bit_width(ints.max())
+        if ints.max() >= (1 << bits):
+            raise ValueError(f"values do not fit in {bits} bits")
+        return pack_bits(ints.astype(np.uint64), bits), {"bits": bits}
+    if codec == "for":
+        reference = int(ints.min())
+        offsets = (ints - reference).astype(np.uint64)
+        bits = _bit_width(offsets.max())
+        return pack_bits(offsets, bits), {"bits": bits, "reference": reference}
+    if codec == "delta":
+        first = int(ints[0])
+        diffs = np.diff(ints)
+        zigzag = ((diffs << 1) ^ (diffs >> 63)).astype(np.uint64)
+        bits = _bit_width(zigzag.max()) if len(zigzag) else 1
+        return pack_bits(zigzag, bits), {"bits": bits, "first": first}
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decode(payload, codec, params, dtype, count):
+    dtype = np.dtype(dtype)
+    if codec == "none":
+        return np.frombuffer(payload, dtype=dtype, count=count)
+    if codec == "zstd":
+        return np.frombuffer(zstandard.ZstdDecompressor().decompress(payload, max_output_size=count * dtype.itemsize), dtype=dtype, count=count)
+    if codec == "lz4":
+        return np.frombuffer(lz4.frame.decompress(payload), dtype=dtype, count=count)
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    if codec == "bitpack":
+        return unpack_bits(payload, params["bits"], count).astype(dtype)
+    if codec == "for":
+        return (unpack_bits(payload, params["bits"], count).astype(np.int64) + params["reference"]).astype(dtype)
+    if codec == "delta":
+        zigzag = unpack_bits(payload, params["bits"], count - 1)
+        diffs = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+        out = np.empty(count, dtype=np.int64)
+        out[0] = params["first"]
+        np.cumsum(diffs, out=out[1:])
+        out[1:] += params["first"]
+        return out.astype(dtype)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def choose_codec(sample, modulus=None, disk_gbps=2.0, candidates=None):
+    """Pick the codec with the lowest estimated read time for a sample chunk.
+
+    read time = encoded bytes / disk bandwidth + measured decode time, so a
+    codec only wins if its compression saves more I/O than its decode costs.
+    """
+    sample = np.ascontiguousarray(sample)
+    best, best_time = "none", None
+    for codec in candidates or available_codecs(sample.dtype):
+        try:
+            payload, params = encode(sample, codec, modulus)
+        except ValueError:
+            continue
+        start = time.perf_counter()
+        decode(payload, codec, params, sample.dtype, len(sample))
+        decode_seconds = time.perf_counter() - start
+        read_seconds = len(payload) / (disk_gbps * 1024**3) + decode_seconds
+        if best_time is None or read_seconds < best_time:
+            best, best_time = codec, read_seconds
+    return best
@@ -1,57 +1,147 @@
-import pandas as pd
+import os
+import time
+import argparse
 import numpy as np
-import struct
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
 
-# Path to the Parquet file and output binary file
+from data_utils_parquet_common import list_parquet_files, sparse_column_to_int
+from data_utils_binary_container import ContainerWriter, DEFAULT_CHUNK_ROWS
+from data_utils_binary_codecs import CODECS
+from data_utils_column_stats import StatsCollector
 
 
-def convert_parquet_to_binary(parquet_file, output_binary_file, metadata_file):
-    # Load the Parquet file
-    df = pd.read_parquet(parquet_file)
+def column_dtype(field):
+    """numpy dtype a parquet column is stored as in the binary file.
+
+    Hex-string sparse columns are decoded to int64 so the binary file holds
+    fixed-width values only.
+    """
+    if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+        return np.dtype(np.int64)
+    return np.dtype(field.type.to_pandas_dtype())
+
+
+def column_to_numpy(array, dtype):
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        return sparse_column_to_int(array)
+    return np.ascontiguousarray(array.fill_null(0), dtype=dtype)
+
 
-    # Get the number of rows and columns
-    num_rows, num_columns = df.shape
+def null_mask(array):
+    """Rows missing in the source column (None when there are none)."""
+    if array.null_count == 0:
+        return None
+    return np.asarray(array.is_null())
+
+
+def convert_parquet_to_binary(parquet_file, output_binary_file, metadata_file):
+    # Sizes come from the footer, so every column extent is known before reading any data
+    pf = pq.ParquetFile(parquet_file)
+    schema = pf.schema_arrow
+    num_rows = pf.metadata.num_rows
 
     # Dictionary to store metadata for each column
     metadata = {
         "num_rows": num_rows,
-        "num_columns": num_columns,
+        "num_columns": len(schema),
         "columns": []
     }
+    offset = 0
+    for field in schema:
+        dtype = column_dtype(field)
+        metadata["columns"].append({
+            "name": field.name,
+            "dtype": dtype.str,         # e.g. '<f4' for float32
+            "offset": offset,           # Start of this column's extent in the binary file
+            "size": num_rows * dtype.itemsize
+        })
+        offset += num_rows * dtype.itemsize
+    # Zone maps per row group, computed from the slices as they are written
+    stats = StatsCollector([field.name for field in schema])
 
-    # Write the data to a single binary file
-    with open(output_binary_file, 'wb') as binary_file:
-        for column in df.columns:
-            # Convert the column data to a numpy array
-            column_data = df[column].to_numpy()
-
-            # Determine the data type
-            dtype = column_data.dtype
-            dtype_str = dtype.str  # Get the data type as a string, e.g., '<f8' for float64
-
-            # Save metadata for this column
-            metadata["columns"].append({
-                "name": column,
-                "dtype": dtype_str,
-                "offset": binary_file.tell(),  # Current position in the binary file
-                "size": column_data.nbytes     # Size in bytes for this column
-            })
-
-            # Write the column data as bytes to the binary file
-            binary_file.write(column_data.tobytes())
+    # Preallocate the whole file, then write each row group's column slices at
+    # their final offsets: only one row group is ever held in memory.
+    fd = os.open(output_binary_file, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if offset > 0:
+            os.posix_fallocate(fd, 0, offset)
+        row_start = 0
+        for rg in range(pf.num_row_groups):
+            table = pf.read_row_group(rg)
+            for column_meta in metadata["columns"]:
+                dtype = np.dtype(column_meta["dtype"])
+                array = table.column(column_meta["name"])
+                column_data = column_to_numpy(array, dtype)
+                stats.update(column_meta["name"], rg, column_data, null_mask(array))
+                position = column_meta["offset"] + row_start * dtype.itemsize
+                view = memoryview(column_data).cast("B")
+                while len(view):
+                    written = os.pwrite(fd, view, position)
+                    view, position = view[written:], position + written
+            row_start += table.num_rows
+    finally:
+        os.close(fd)
+    metadata["stats"] = stats.to_dict()
 
     # Save metadata to a text file for easy access during reads
     with open(metadata_file, 'w') as f:
         f.write(str(metadata))
+    return metadata
+
+
+def convert_parquet_to_container(parquet_file, output_file, chunk_rows=DEFAULT_CHUNK_ROWS, codec="none", modulus=None):
+    """Same streaming conversion, written as a versioned container (see data_utils_binary_container).
+
+    codec applies to every column ("auto" picks per column from the first
+    chunk). With modulus set, hex sparse columns are stored mod modulus so they
+    can be bit-packed to ceil(log2(modulus)) bits.
+    """
+    pf = pq.ParquetFile(parquet_file)
+    columns = [(field.name, column_dtype(field)) for field in pf.schema_arrow]
+    sparse = {field.name for field in pf.schema_arrow
+              if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)}
+    codec_params = {name: {"modulus": modulus} for name in sparse} if modulus else None
+    with ContainerWriter(output_file, pf.metadata.num_rows, columns, chunk_rows, codec, codec_params) as writer:
+        for rg in range(pf.num_row_groups):
+            table = pf.read_row_group(rg)
+            for name, dtype in columns:
+                array = table.column(name)
+                values = column_to_numpy(array, dtype)
+                if modulus and name in sparse:
+                    values = np.mod(values, modulus)
+                writer.write(name, values, null_mask(array))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Parquet files to the binary column store")
+    parser.add_argument("--data-dir", type=str, required=True, help="Folder containing Parquet files")
+    parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
+    parser.add_argument("--output-dir", type=str, required=True, help="Folder to write .bin and metadata files")
+    parser.add_argument("--n-jobs", type=int, default=8, help="Files converted in parallel (memory: one row group per job)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per indexed/checksummed chunk")
+    parser.add_argument("--codec", type=str, default="none", choices=["auto"] + CODECS, help="Per-chunk codec for every column ('auto' picks per column)")
+    parser.add_argument("--modulus", type=int, default=None, help="Store sparse columns mod M (lets bitpack use ceil(log2(M)) bits)")
+    parser.add_argument("--legacy", action="store_true", help="Write the old .bin + str(dict) metadata .txt layout")
+    args = parser.parse_args()
+
+    file_list = list_parquet_files(args.data_dir, args.file_pattern)
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"Converting {len(file_list)} Parquet files to binary")
+
+    start_time = time.time()
+    tasks = []
+    for parquet_file in file_list:
+        base = os.path.join(args.output_dir, os.path.basename(parquet_file).replace(".parquet", ""))
+        if args.legacy:
+            tasks.append(delayed(convert_parquet_to_binary)(parquet_file, f"{base}.bin", f"{base}_metadata.txt"))
+        else:
+            tasks.append(delayed(convert_parquet_to_container)(parquet_file, f"{base}.bin", args.chunk_rows, args.codec, args.modulus))
+    Parallel(n_jobs=args.n_jobs)(tasks)
+
+    total_time = time.time() - start_time
+    print(f"\nTotal execution time: {total_time:.2f} seconds")
 
-print("Converting Parquet to Binary for 13 dense and 26 sparse columns")
-parquet_file = "/local/home/yuzhuyu/bin2parquet.parquet"
-output_binary_file = "/local/home/yuzhuyu/columnar_data_13_dense_26_sparse.bin"
-metadata_file = "/local/home/yuzhuyu/columnar_metadata_13_dense_26_sparse.txt"
-convert_parquet_to_binary(parquet_file, output_binary_file, metadata_file)
-
-print("Converting Parquet to Binary for 504 dense and 42 sparse columns")
-parquet_file = "/local/home/yuzhuyu/pseudo_dataset_504_dense_42_sparse.parquet"
-output_binary_file = "/local/home/yuzhuyu/columnar_data_504_dense_42_sparse.bin"
-metadata_file = "/local/home/yuzhuyu/columnar_metadata_504_dense_42_sparse.txt"
-convert_parquet_to_binary(parquet_file, output_binary_file, metadata_file)
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,8 @@ from joblib import Parallel, delayed
 import numpy as np
 import time
 import argparse
-import struct
+
+from data_utils_binary_reader import row_major_column, materialize
 
 # Argument parser
 parser = argparse.ArgumentParser(description='Benchmark for rec_preprocessing')
@@ -19,25 +20,10 @@ num_rows = 45840617  # Replace with the actual number of rows in your binary fil
 
 # Define the function to read a specific column from a binary file
 def read_column_from_binary(column_index, num_rows, row_size, dtype):
-    # Define the struct format for different data types
-    dtype_formats = {
-        np.int32: 'i',  # 4-byte integer
-        np.float32: 'f' # 4-byte float
-    }
-    
-    # Get the correct format string for the specified dtype
-    format_string = dtype_formats[dtype]
-    data = []
-    
-    with open(binary_file, "rb") as f:
-        for row in range(num_rows):
-            # Calculate the byte offset for the specific column in this row
-            offset = row * row_size + column_index * dtype().nbytes
-            f.seek(offset)
-            # Read and unpack the value using the format string
-            data.append(struct.unpack(format_string, f.read(dtype().nbytes))[0])
-    
-    return np.array(data)
+    # Strided memmap view of the column: one pass over its bytes instead of a
+    # seek + read + unpack per row
+    view = row_major_column(binary_file, num_rows, row_size, column_index * np.dtype(dtype).itemsize, dtype)
+    return materialize(view, n_threads=4)
 
 # Define your pipeline functions using `read_column_from_binary`
 def process_column_in_pipeline_0(column_index, num_rows, row_size):
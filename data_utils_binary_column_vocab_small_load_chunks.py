@@ -1,6 +1,9 @@
 from joblib import Parallel, delayed
 import time
 import argparse
+import numpy as np
+
+from data_utils_binary_reader import criteo_row_dtype, load_row_major_columns
 
 # Argument parser
 parser = argparse.ArgumentParser(description='Benchmark for rec_preprocessing')
@@ -15,35 +18,28 @@ num_rows = 45840617  # Replace with the actual number of rows in your binary fil
 dense_feature = 13
 sparse_feature = 26
 
-# Define row size for the binary data
-row_size = (1 * 4 + dense_feature * 4 + sparse_feature * 4)  # 4 bytes for each int32 or float32 entry
-
-# Define the function to read a chunk of data from the binary file
-def read_binary_chunk(start_row, end_row, row_size):
-    with open(binary_file, "rb") as f:
-        # Seek to the start of the chunk
-        f.seek(start_row * row_size)
-        # Read the specified number of rows as one large chunk
-        f.read((end_row - start_row) * row_size)
-
-# Main function to process in parallel
+# Main function to load the file into per-column arrays in parallel
 def main():
     args = parser.parse_args()
     n_jobs = args.n_jobs
 
-    # Split the work into chunks based on the number of jobs
-    rows_per_job = num_rows // n_jobs
     start_time = time.time()
 
-    # Run parallel jobs to read the file in chunks
-    Parallel(n_jobs=n_jobs)(
-        delayed(read_binary_chunk)(i * rows_per_job, (i + 1) * rows_per_job, row_size)
-        for i in range(n_jobs)
+    # Threads preadv row ranges into reused buffers and transpose them into column arrays
+    row_dtype = criteo_row_dtype(dense_feature, sparse_feature)
+    columns = load_row_major_columns(binary_file, row_dtype, num_rows, n_threads=n_jobs)
+
+    load_time = time.time() - start_time
+    print(f"\nTotal execution time for loading: {load_time:.2f} seconds")
+
+    # Hand the sparse columns to pipeline 2 (modulus)
+    sparse_columns = [f"col_{i}" for i in range(1 + dense_feature, 1 + dense_feature + sparse_feature)]
+    Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(np.mod)(columns[col], args.modulus, out=columns[col]) for col in sparse_columns
     )
 
-    # Record the end time and calculate the total execution time
     total_time = time.time() - start_time
-    print(f"\nTotal execution time for loading: {total_time:.2f} seconds")
+    print(f"Total execution time including pipeline 2: {total_time:.2f} seconds")
 
 # Entry point for the program
 if __name__ == "__main__":
@@ -0,0 +1,369 @@
+import os
+import json
+import zlib
+import struct
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from data_utils_binary_codecs import INTEGER_CODECS, encode, decode, choose_codec
+from data_utils_column_stats import StatsCollector
+
+# ----------------------------------------
+# Binary column container
+#
+# [0, 4096)            prefix: magic, version, index offset, index length
+# [4096, ...)          one extent per raw (codec "none") column, each starting
+#                      on a 4 KiB boundary
+# [..., index_offset)  encoded chunks of the other columns, each starting on a
+#                      4 KiB boundary (version 2)
+# [index_offset, ...)  JSON index: rows, columns (dtype, codec, offset, length)
+#                      and per-chunk row ranges -> byte ranges + crc32 (+ codec
+#                      params for encoded chunks), plus "stats": per-chunk zone
+#                      maps and per-column sketches (see data_utils_column_stats)
+#
+# The index is written last (its checksums are only known after the data), the
+# fixed-size prefix at offset 0 points at it.
+# ----------------------------------------
+MAGIC = b"RECBCOL\0"
+VERSION = 2
+ALIGNMENT = 4096
+PREFIX = struct.Struct("<8sIIQQ")  # magic, version, reserved, index offset, index length
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+
+def align_up(value, alignment=ALIGNMENT):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _pwrite_all(fd, data, position):
+    view = memoryview(data).cast("B")
+    while len(view):
+        written = os.pwrite(fd, view, position)
+        view, position = view[written:], position + written
+
+
+def _pread_all(fd, length, position):
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    while len(view):
+        n = os.preadv(fd, [view], position)
+        if n == 0:
+            raise EOFError(f"Unexpected end of file at byte {position}")
+        view, position = view[n:], position + n
+    return buffer
+
+
+def container_layout(num_rows, columns, codecs=None):
+    """Column extents for [(name, dtype)]: each raw column starts on a 4 KiB boundary after the prefix.
+
+    Columns with a codec other than "none" get no extent; their chunks are
+    appended after the raw extents as they are encoded.
+    """
+    codecs = codecs or {}
+    layout = []
+    offset = ALIGNMENT
+    for name, dtype in columns:
+        dtype = np.dtype(dtype)
+        codec = codecs.get(name, "none")
+        if codec == "none":
+            length = num_rows * dtype.itemsize
+            layout.append({"name": name, "dtype": dtype.str, "codec": codec, "offset": offset, "length": length})
+            offset = align_up(offset + length)
+        else:
+            layout.append({"name": name, "dtype": dtype.str, "codec": codec, "offset": None, "length": 0})
+    return layout, offset
+
+
+def build_index(num_rows, chunk_rows, layout, crcs, encoded_chunks=None):
+    """Container index; crcs maps raw column name -> list of per-chunk crc32,
+    encoded_chunks maps encoded column name -> list of per-chunk entries."""
+    encoded_chunks = encoded_chunks or {}
+    chunks = []
+    for i in range((num_rows + chunk_rows - 1) // chunk_rows):
+        row_start, row_end = i * chunk_rows, min((i + 1) * chunk_rows, num_rows)
+        entry = {"row_start": row_start, "row_end": row_end, "columns": {}}
+        for column in layout:
+            if column["name"] in encoded_chunks:
+                entry["columns"][column["name"]] = encoded_chunks[column["name"]][i]
+                continue
+            itemsize = np.dtype(column["dtype"]).itemsize
+            entry["columns"][column["name"]] = {
+                "offset": column["offset"] + row_start * itemsize,
+                "length": (row_end - row_start) * itemsize,
+                "crc32": crcs[column["name"]][i],
+            }
+        chunks.append(entry)
+    return {
+        "version": VERSION,
+        "num_rows": num_rows,
+        "chunk_rows": chunk_rows,
+        "alignment": ALIGNMENT,
+        "columns": layout,
+        "chunks": chunks,
+    }
+
+
+def write_index(fd, index, index_offset):
+    payload = json.dumps(index).encode()
+    _pwrite_all(fd, payload, index_offset)
+    os.ftruncate(fd, index_offset + len(payload))
+    _pwrite_all(fd, PREFIX.pack(MAGIC, VERSION, 0, index_offset, len(payload)), 0)
+
+
+class ContainerWriter:
+    """Writes a container with preallocated, 4 KiB aligned column extents.
+
+    Rows of a column must be written in order (any slice size); the writer
+    splits them at chunk boundaries and keeps a running crc32 per chunk.
+
+    codecs maps column -> codec (see data_utils_binary_codecs) or "auto";
+    encoded columns buffer one chunk, encode it on its own and append it.
+    "auto" picks the codec from the first chunk. codec_params maps column ->
+    {"modulus": m} to bit-pack categorical IDs to ceil(log2(m)) bits.
+
+    With stats=True, min/max/null count/distinct estimate of every chunk (and
+    label counts of label_columns) are computed from the same slices.
+    """
+
+    def __init__(self, path, num_rows, columns, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 codecs=None, codec_params=None, disk_gbps=2.0, stats=True, label_columns=("col_0",)):
+        if chunk_rows % ALIGNMENT != 0:
+            raise ValueError(f"chunk_rows must be a multiple of {ALIGNMENT} so chunks stay block aligned")
+        self.path = path
+        self.num_rows = num_rows
+        self.chunk_rows = chunk_rows
+        self.num_chunks = (num_rows + chunk_rows - 1) // chunk_rows
+        if isinstance(codecs, str):
+            # Integer-only codecs fall back to raw storage for float columns
+            codecs = {name: codecs if codecs not in INTEGER_CODECS or np.dtype(dtype).kind in "iu" else "none"
+                      for name, dtype in columns}
+        self.columns, self.data_end = container_layout(num_rows, columns, codecs)
+        self.codec_params = codec_params or {}
+        self.disk_gbps = disk_gbps
+        self._by_name = {c["name"]: c for c in self.columns}
+        self._rows_written = {c["name"]: 0 for c in self.columns}
+        self._crcs = {c["name"]: [0] * self.num_chunks for c in self.columns}
+        self._pending = {c["name"]: [] for c in self.columns if c["codec"] != "none"}
+        self._encoded = {name: [] for name in self._pending}
+        self._append_offset = self.data_end
+        self._stats = StatsCollector([c["name"] for c in self.columns], label_columns) if stats else None
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.posix_fallocate(self.fd, 0, self.data_end)
+
+    def _chunk_slices(self, row, count):
+        # (chunk, start, end) of every chunk a slice of count rows at row touches
+        start = 0
+        while start < count:
+            chunk = (row + start) // self.chunk_rows
+            end = min(count, (chunk + 1) * self.chunk_rows - row)
+            yield chunk, start, end
+            start = end
+
+    def write(self, name, values, nulls=None):
+        """Append the next rows of a column at their final offset.
+
+        nulls optionally marks rows that were missing in the source (already
+        filled in values); it only feeds the null counts of the statistics.
+        """
+        column = self._by_name[name]
+        values = np.ascontiguousarray(values, dtype=np.dtype(column["dtype"]))
+        row = self._rows_written[name]
+        if row + len(values) > self.num_rows:
+            raise ValueError(f"Too many rows written for column {name}")
+        if self._stats is not None:
+            for chunk, start, end in self._chunk_slices(row, len(values)):
+                self._stats.update(name, chunk, values[start:end], None if nulls is None else nulls[start:end])
+        if name in self._pending:
+            self._write_encoded(column, values)
+            return
+        itemsize = values.dtype.itemsize
+        _pwrite_all(self.fd, values, column["offset"] + row * itemsize)
+        # Update the running checksum of every chunk this slice touches
+        for chunk, start, end in self._chunk_slices(row, len(values)):
+            self._crcs[name][chunk] = zlib.crc32(memoryview(values[start:end]).cast("B"), self._crcs[name][chunk])
+        self._rows_written[name] = row + len(values)
+
+    def _write_encoded(self, column, values):
+        name = column["name"]
+        self._pending[name].append(values)
+        self._rows_written[name] += len(values)
+        pending_rows = sum(len(v) for v in self._pending[name])
+        chunk_start = len(self._encoded[name]) * self.chunk_rows
+        while pending_rows >= self.chunk_rows or (pending_rows and chunk_start + pending_rows == self.num_rows):
+            buffered = np.concatenate(self._pending[name])
+            take = min(self.chunk_rows, len(buffered))
+            self._append_chunk(column, buffered[:take])
+            self._pending[name] = [buffered[take:]] if take < len(buffered) else []
+            pending_rows -= take
+            chunk_start += take
+
+    def _append_chunk(self, column, values):
+        name = column["name"]
+        params = self.codec_params.get(name, {})
+        if column["codec"] == "auto":
+            column["codec"] = choose_codec(values, params.get("modulus"), self.disk_gbps)
+        payload, chunk_params = encode(values, column["codec"], params.get("modulus"))
+        offset = self._append_offset
+        _pwrite_all(self.fd, payload, offset)
+        self._append_offset = align_up(offset + len(payload))
+        column["length"] += len(payload)
+        self._encoded[name].append({"offset": offset, "length": len(payload),
+                                    "crc32": zlib.crc32(payload), "params": chunk_params})
+
+    def index(self):
+        index = build_index(self.num_rows, self.chunk_rows, self.columns, self._crcs, self._encoded)
+        if self._stats is not None:
+            index["stats"] = self._stats.to_dict()
+        return index
+
+    def close(self, extra=None):
+        for name, rows in self._rows_written.items():
+            if rows != self.num_rows:
+                raise ValueError(f"Column {name} has {rows} rows, expected {self.num_rows}")
+        index = self.index()
+        if extra:
+            index.update(extra)
+        write_index(self.fd, index, self._append_offset)
+        os.close(self.fd)
+        return index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            os.close(self.fd)
+            return
+        self.close()
+
+
+def read_index(path):
+    """Parse the container prefix and JSON index (no data is read)."""
+    with open(path, "rb") as f:
+        magic, version, _, index_offset, index_length = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary column container")
+        if version > VERSION:
+            raise ValueError(f"{path} has container version {version}, this reader supports up to {VERSION}")
+        f.seek(index_offset)
+        return json.loads(f.read(index_length))
+
+
+def has_raw_extent(column):
+    """True if the column is stored as one contiguous raw extent (memory-mappable)."""
+    return column.get("codec", "none") == "none" and column["offset"] is not None
+
+
+def column_entry(index, name):
+    for column in index["columns"]:
+        if column["name"] == name:
+            return column
+    raise KeyError(f"No column {name} in container")
+
+
+def _decode_chunk(fd, index, column, chunk):
+    entry = index["chunks"][chunk]["columns"][column["name"]]
+    data = _pread_all(fd, entry["length"], entry["offset"])
+    count = index["chunks"][chunk]["row_end"] - index["chunks"][chunk]["row_start"]
+    # Version 1 containers have no codec field: every column is raw
+    return decode(data, column.get("codec", "none"), entry.get("params", {}), column["dtype"], count)
+
+
+def read_chunk(path, name, chunk, index=None):
+    """Read (and decode) one chunk of one column with a single positional read."""
+    index = index or read_index(path)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return _decode_chunk(fd, index, column_entry(index, name), chunk)
+    finally:
+        os.close(fd)
+
+
+def read_column(path, name, n_threads=8, index=None):
+    """Read a whole column, decoding its independent chunks in parallel."""
+    index = index or read_index(path)
+    column = column_entry(index, name)
+    out = np.empty(index["num_rows"], dtype=np.dtype(column["dtype"]))
+    fd = os.open(path, os.O_RDONLY)
+
+    def load(chunk):
+        bounds = index["chunks"][chunk]
+        out[bounds["row_start"]:bounds["row_end"]] = _decode_chunk(fd, index, column, chunk)
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(load, range(len(index["chunks"]))))
+    finally:
+        os.close(fd)
+    return out
+
+
+def verify_container(path, n_threads=8, index=None):
+    """Check every (chunk, column) crc32 in parallel; returns the list of mismatches."""
+    index = index or read_index(path)
+    tasks = [(i, name, entry) for i, chunk in enumerate(index["chunks"])
+             for name, entry in chunk["columns"].items()]
+    fd = os.open(path, os.O_RDONLY)
+
+    def check(task):
+        i, name, entry = task
+        # zlib releases the GIL on large buffers, so threads verify in parallel
+        crc = zlib.crc32(_pread_all(fd, entry["length"], entry["offset"]))
+        return None if crc == entry["crc32"] else (i, name)
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            results = list(executor.map(check, tasks))
+    finally:
+        os.close(fd)
+    return [r for r in results if r is not None]
+
+
+# ----------------------------------------
+# Out-of-order writers (e.g. parallel mmap writes): preallocate, fill, then seal
+# ----------------------------------------
+def create_container(path, num_rows, columns):
+    """Preallocate a container file; returns (layout, data_end) for writing the extents directly."""
+    layout, data_end = container_layout(num_rows, columns)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.posix_fallocate(fd, 0, data_end)
+    finally:
+        os.close(fd)
+    return layout, data_end
+
+
+def seal_container(path, num_rows, layout, data_end, chunk_rows=DEFAULT_CHUNK_ROWS, n_threads=8, extra=None,
+                   stats=True, label_columns=("col_0",)):
+    """Checksum (and compute statistics of) every chunk of a filled container in parallel and write its index."""
+    if chunk_rows % ALIGNMENT != 0:
+        raise ValueError(f"chunk_rows must be a multiple of {ALIGNMENT} so chunks stay block aligned")
+    crcs = {column["name"]: [0] * ((num_rows + chunk_rows - 1) // chunk_rows) for column in layout}
+    unsealed = build_index(num_rows, chunk_rows, layout, crcs)
+    tasks = [(i, name, entry) for i, chunk in enumerate(unsealed["chunks"])
+             for name, entry in chunk["columns"].items()]
+    dtypes = {column["name"]: np.dtype(column["dtype"]) for column in layout}
+    collector = StatsCollector(list(dtypes), label_columns) if stats else None
+    fd = os.open(path, os.O_RDWR)
+    try:
+        def checksum(task):
+            i, name, entry = task
+            data = _pread_all(fd, entry["length"], entry["offset"])
+            crcs[name][i] = zlib.crc32(data)
+            if collector is not None:
+                chunk_stats = collector.new_chunk(name)
+                chunk_stats.update(np.frombuffer(data, dtype=dtypes[name]))
+                collector.add(name, i, chunk_stats)
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(checksum, tasks))
+        index = build_index(num_rows, chunk_rows, layout, crcs)
+        if collector is not None:
+            index["stats"] = collector.to_dict()
+        if extra:
+            index.update(extra)
+        write_index(fd, index, data_end)
+    finally:
+        os.close(fd)
+    return index
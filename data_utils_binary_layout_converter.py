@@ -0,0 +1,107 @@
+import os
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from data_utils_binary_reader import criteo_row_dtype, open_row_major, open_column_major
+from data_utils_binary_container import DEFAULT_CHUNK_ROWS, create_container, seal_container
+
+# Bytes of source + destination a tile may touch; keep it within a per-core L2
+DEFAULT_TILE_BYTES = 512 * 1024
+
+
+def _row_ranges(num_rows, n_jobs, align=DEFAULT_CHUNK_ROWS):
+    # One contiguous row range per job; boundaries on container chunks keep
+    # each chunk's pages owned by a single writer
+    step = max((num_rows + n_jobs - 1) // n_jobs, 1)
+    step = (step + align - 1) // align * align
+    return [(start, min(start + step, num_rows)) for start in range(0, num_rows, step)]
+
+
+def _tiled_copy(row_range, tile_rows, copy_tile):
+    start, end = row_range
+    for t0 in range(start, end, tile_rows):
+        copy_tile(t0, min(t0 + tile_rows, end))
+
+
+# ----------------------------------------
+# Row-major -> column-major (binary column container)
+# ----------------------------------------
+def row_to_column(src_path, dst_path, row_dtype, chunk_rows=DEFAULT_CHUNK_ROWS, n_jobs=8, tile_bytes=DEFAULT_TILE_BYTES):
+    src = open_row_major(src_path, row_dtype)
+    num_rows = len(src)
+    layout, data_end = create_container(dst_path, num_rows, [(name, row_dtype.fields[name][0]) for name in row_dtype.names])
+    dst = {}
+    if num_rows > 0:
+        dst = {column["name"]: np.memmap(dst_path, dtype=np.dtype(column["dtype"]), mode="r+",
+                                         offset=column["offset"], shape=(num_rows,))
+               for column in layout}
+    tile_rows = max(tile_bytes // (2 * row_dtype.itemsize), 1)
+
+    def copy_tile(t0, t1):
+        # The tile of rows is read once and scattered to every column while it is in cache
+        tile = src[t0:t1]
+        for name in row_dtype.names:
+            dst[name][t0:t1] = tile[name]
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        list(executor.map(lambda r: _tiled_copy(r, tile_rows, copy_tile), _row_ranges(num_rows, n_jobs, chunk_rows)))
+    for column in dst.values():
+        column.flush()
+    return seal_container(dst_path, num_rows, layout, data_end, chunk_rows, n_jobs)
+
+
+# ----------------------------------------
+# Column-major (binary column container) -> row-major
+# ----------------------------------------
+def column_to_row(src_path, dst_path, row_dtype, n_jobs=8, tile_bytes=DEFAULT_TILE_BYTES):
+    src = open_column_major(src_path)
+    missing = [name for name in row_dtype.names if name not in src]
+    if missing:
+        raise ValueError(f"{src_path} has no columns {missing}")
+    num_rows = len(src[row_dtype.names[0]])
+    dst = np.memmap(dst_path, dtype=row_dtype, mode="w+", shape=(num_rows,)) if num_rows else None
+    tile_rows = max(tile_bytes // (2 * row_dtype.itemsize), 1)
+
+    def copy_tile(t0, t1):
+        # Gather one tile of every column into a contiguous block of rows
+        tile = dst[t0:t1]
+        for name in row_dtype.names:
+            tile[name] = src[name][t0:t1]
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        list(executor.map(lambda r: _tiled_copy(r, tile_rows, copy_tile), _row_ranges(num_rows, n_jobs, 1)))
+    if dst is not None:
+        dst.flush()
+    else:
+        open(dst_path, "wb").close()
+    return num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert binary stores between row-major and column-major layouts")
+    parser.add_argument("--direction", choices=["row-to-column", "column-to-row"], required=True)
+    parser.add_argument("--input", type=str, required=True, help="Input binary file")
+    parser.add_argument("--output", type=str, required=True, help="Output binary file")
+    parser.add_argument("--dense-feature", type=int, default=13, help="Number of dense columns (e.g. 13 or 504)")
+    parser.add_argument("--sparse-feature", type=int, default=26, help="Number of sparse columns (e.g. 26 or 42)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per container chunk")
+    parser.add_argument("--tile-kb", type=int, default=DEFAULT_TILE_BYTES // 1024, help="Transpose tile size in KiB (fit L2)")
+    parser.add_argument("--n-jobs", type=int, default=8, help="Threads working on separate row ranges")
+    args = parser.parse_args()
+
+    row_dtype = criteo_row_dtype(args.dense_feature, args.sparse_feature)
+    start_time = time.time()
+    if args.direction == "row-to-column":
+        index = row_to_column(args.input, args.output, row_dtype, args.chunk_rows, args.n_jobs, args.tile_kb * 1024)
+        num_rows = index["num_rows"]
+    else:
+        num_rows = column_to_row(args.input, args.output, row_dtype, args.n_jobs, args.tile_kb * 1024)
+
+    total_time = time.time() - start_time
+    size_gb = os.path.getsize(args.input) / 1024**3
+    print(f"Converted {num_rows:,} rows ({args.direction}) in {total_time:.2f} seconds ({size_gb / max(total_time, 1e-9):.2f} GB/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import queue
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from data_utils_binary_container import read_index, read_column, column_entry, has_raw_extent
+
+# ----------------------------------------
+# Memory-mapped column access for the binary row / column stores
+#
+# Row-major files (label, dense..., sparse... per row) give a strided view per
+# column; column-major containers give a contiguous slice per column. Neither
+# reads any data until the view is touched.
+# ----------------------------------------
+def criteo_row_dtype(dense_feature=13, sparse_feature=26):
+    """Structured dtype of one row of the row-major binary files (int32 label, float32 dense, int32 sparse)."""
+    fields = [("col_0", "<i4")]
+    fields += [(f"col_{i}", "<f4") for i in range(1, 1 + dense_feature)]
+    fields += [(f"col_{i}", "<i4") for i in range(1 + dense_feature, 1 + dense_feature + sparse_feature)]
+    return np.dtype(fields)
+
+
+def open_row_major(path, row_dtype, num_rows=None):
+    """Structured memmap over a row-major file; store[name] is a strided column view."""
+    row_dtype = np.dtype(row_dtype)
+    if num_rows is None:
+        num_rows = os.path.getsize(path) // row_dtype.itemsize
+    return np.memmap(path, dtype=row_dtype, mode="r", shape=(num_rows,))
+
+
+def row_major_column(path, num_rows, row_size, byte_offset, dtype):
+    """Strided view of one column of a row-major file given the raw row layout."""
+    buffer = np.memmap(path, dtype=np.uint8, mode="r", shape=(num_rows * row_size,))
+    return np.ndarray(shape=(num_rows,), dtype=np.dtype(dtype), buffer=buffer,
+                      offset=byte_offset, strides=(row_size,))
+
+
+def column_major_column(path, name, index=None):
+    """Contiguous memmap slice of one column of a binary column container."""
+    index = index or read_index(path)
+    column = column_entry(index, name)
+    if not has_raw_extent(column):
+        raise ValueError(f"Column {name} is stored as encoded chunks ({column['codec']}); use read_column to decode it")
+    return np.memmap(path, dtype=np.dtype(column["dtype"]), mode="r",
+                     offset=column["offset"], shape=(index["num_rows"],))
+
+
+def open_column_major(path, n_threads=8):
+    """All columns of a container as {name: contiguous array}.
+
+    Raw columns are memmaps; encoded columns are decoded chunk-parallel.
+    """
+    index = read_index(path)
+    return {column["name"]: column_major_column(path, column["name"], index)
+            if has_raw_extent(column) else read_column(path, column["name"], n_threads, index)
+            for column in index["columns"]}
+
+
+def materialize(view, n_threads=8, out=None):
+    """Copy a (possibly strided) view into a contiguous array with a multi-threaded copy.
+
+    np.copyto releases the GIL, so each thread copies (and faults in) its own
+    row range; the column's bytes are touched exactly once.
+    """
+    if out is None:
+        out = np.empty(view.shape, dtype=view.dtype)
+    n = len(view)
+    if n == 0:
+        return out
+    step = (n + n_threads - 1) // n_threads
+    ranges = [(start, min(start + step, n)) for start in range(0, n, step)]
+
+    def copy(bounds):
+        start, end = bounds
+        np.copyto(out[start:end], view[start:end])
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        list(executor.map(copy, ranges))
+    return out
+
+
+# ----------------------------------------
+# Parallel chunk loader for row-major files
+# ----------------------------------------
+def load_row_major_columns(path, row_dtype, num_rows=None, chunk_rows=1 << 18, n_threads=8, block_bytes=256 * 1024):
+    """Read a row-major file into preallocated per-column arrays.
+
+    The file is split into row ranges; each worker preadv()s a range into one of
+    n_threads reused buffers and transposes it block by block (block_bytes of
+    rows, sized to stay in L2) into the column arrays. Reads of one range
+    overlap with transposes of others.
+    """
+    row_dtype = np.dtype(row_dtype)
+    row_size = row_dtype.itemsize
+    if num_rows is None:
+        num_rows = os.path.getsize(path) // row_size
+    columns = {name: np.empty(num_rows, dtype=row_dtype.fields[name][0]) for name in row_dtype.names}
+    ranges = [(start, min(start + chunk_rows, num_rows)) for start in range(0, num_rows, chunk_rows)]
+    block_rows = max(block_bytes // row_size, 1)
+
+    buffers = queue.Queue()
+    for _ in range(min(n_threads, max(len(ranges), 1))):
+        buffers.put(bytearray(chunk_rows * row_size))
+
+    fd = os.open(path, os.O_RDONLY)
+
+    def load(bounds):
+        start, end = bounds
+        buffer = buffers.get()
+        try:
+            view = memoryview(buffer)[:(end - start) * row_size]
+            done = 0
+            while done < len(view):
+                n = os.preadv(fd, [view[done:]], start * row_size + done)
+                if n == 0:
+                    raise EOFError(f"Unexpected end of {path} at row {start}")
+                done += n
+            rows = np.frombuffer(buffer, dtype=row_dtype, count=end - start)
+            # Cache-blocked transpose: each block of rows is scattered to every column while hot
+            for b0 in range(0, end - start, block_rows):
+                b1 = min(b0 + block_rows, end - start)
+                block = rows[b0:b1]
+                for name in row_dtype.names:
+                    columns[name][start + b0:start + b1] = block[name]
+        finally:
+            buffers.put(buffer)
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(load, ranges))
+    finally:
+        os.close(fd)
+    return columns
@@ -4,6 +4,8 @@ import random
 import pyarrow as pa
 import pyarrow.parquet as pq
 
+from data_utils_parquet_common import BufferedParquetWriter
+
 def generate_pseudo_parquet(output_parquet,
                              num_rows=45840617,
                              target_column='col_0',
@@ -36,10 +38,9 @@ def generate_pseudo_parquet(output_parquet,
 
     # Step 5: Convert to PyArrow Table and write with multiple row groups
     table = pa.Table.from_pandas(df, preserve_index=False)
-    pq.write_table(table,
-                   output_parquet,
-                   compression=None,
-                   row_group_size=row_group_size)
+    # Per-row-group sketches and label counts go into the footer metadata
+    with BufferedParquetWriter(output_parquet, table.schema, row_group_size, stats=True, compression=None) as writer:
+        writer.write_table(table)
 
     # Step 6: Report row group count
     pf = pq.ParquetFile(output_parquet)
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from tqdm import tqdm
+from joblib import Parallel, delayed
+
+from data_utils_parquet_common import SPARSE_COLUMNS, list_parquet_files, sparse_column_to_int, iter_row_groups
+
+SKETCH_FILE = "cardinality_sketch.json"
+REGISTERS_FILE = "cardinality_sketch_registers.npz"
+DEFAULT_PRECISION = 14  # 16384 registers, ~0.8% standard error
+
+# ----------------------------------------
+# Vectorized HyperLogLog
+# ----------------------------------------
+def hash64(values):
+    """splitmix64 finalizer applied to an int64/uint64 array (wrapping arithmetic)."""
+    with np.errstate(over="ignore"):
+        x = values.astype(np.uint64, copy=True)
+        x ^= x >> np.uint64(30)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(27)
+        x *= np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+    return x
+
+
+def _bit_length(x):
+    # Exact bit length of uint64 values: frexp is exact on the 32-bit halves
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+def hll_update(registers, values, precision=DEFAULT_PRECISION):
+    """Fold an array of integer keys into HLL registers in place."""
+    if len(values) == 0:
+        return registers
+    h = hash64(values)
+    index = (h >> np.uint64(64 - precision)).astype(np.int64)
+    rest = h & np.uint64((1 << (64 - precision)) - 1)
+    rank = ((64 - precision) - _bit_length(rest) + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def hll_estimate(registers):
+    """Cardinality estimate with the small-range (linear counting) correction."""
+    m = registers.shape[0]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * m and zeros > 0:
+        return m * np.log(m / zeros)
+    return raw
+
+
+def sketch_file(file, columns, modulus, precision=DEFAULT_PRECISION):
+    """Per-file registers for every column, one row group in memory at a time."""
+    registers = {col: np.zeros(1 << precision, dtype=np.uint8) for col in columns}
+    num_rows = 0
+    for _, table in iter_row_groups(file, columns=columns):
+        num_rows += table.num_rows
+        for col in columns:
+            # Missing values are not keys (sparse_column_to_int would count them as 0)
+            hll_update(registers[col], sparse_column_to_int(table.column(col).drop_null(), modulus), precision)
+    return registers, num_rows
+
+
+# ----------------------------------------
+# Persistence and planning helpers for the vocab builders / drivers
+# ----------------------------------------
+def save_cardinality_sketch(data_dir, registers, num_rows, num_files, modulus, precision):
+    estimates = {col: int(round(min(hll_estimate(reg), modulus) if modulus else hll_estimate(reg)))
+                 for col, reg in registers.items()}
+    summary = {
+        "precision": precision,
+        "modulus": modulus,
+        "num_rows": num_rows,
+        "num_files": num_files,
+        "estimates": estimates,
+    }
+    with open(os.path.join(data_dir, SKETCH_FILE), "w") as f:
+        json.dump(summary, f, indent=2)
+    np.savez(os.path.join(data_dir, REGISTERS_FILE), **registers)
+    return summary
+
+
+def load_cardinality_estimates(data_dir):
+    """Return the persisted sketch summary for a dataset directory (local or fsspec URL), or None."""
+    if "://" in data_dir:
+        # Imported here: only remote datasets (gs://, s3://) need it
+        import fsspec
+        fs, path = fsspec.core.url_to_fs(f"{data_dir.rstrip('/')}/{SKETCH_FILE}")
+        if not fs.exists(path):
+            return None
+        with fs.open(path, "r") as f:
+            return json.load(f)
+    path = os.path.join(data_dir, SKETCH_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def plan_vocab_tables(summary, memory_budget_bytes=None, id_bytes=8):
+    """Pick a vocab structure and capacity per column from the estimates.
+
+    - "dense_lut": modulus-bounded domain small enough for a direct lookup table
+    - "sorted_array": sorted key array + searchsorted, sized from the estimate
+    Columns are flagged with "spill" when the running total exceeds the budget.
+    """
+    modulus = summary.get("modulus")
+    plan = {}
+    total_bytes = 0
+    for col, estimate in summary["estimates"].items():
+        # Leave ~3% head-room for the HLL error
+        capacity = int(estimate * 1.03) + 1
+        if modulus:
+            capacity = min(capacity, modulus)
+        lut_bytes = modulus * id_bytes if modulus else None
+        sorted_bytes = capacity * (8 + id_bytes)
+        if lut_bytes is not None and lut_bytes <= 2 * sorted_bytes:
+            structure, nbytes = "dense_lut", lut_bytes
+        else:
+            structure, nbytes = "sorted_array", sorted_bytes
+        total_bytes += nbytes
+        plan[col] = {
+            "estimate": estimate,
+            "capacity": capacity,
+            "structure": structure,
+            "bytes": nbytes,
+            "spill": bool(memory_budget_bytes and total_bytes > memory_budget_bytes),
+        }
+    return plan
+
+
+def suggest_part_size(summary, device_bytes, fraction=0.15, id_bytes=8):
+    """Partition size for the dask/NVTabular drivers that leaves room for the vocab tables."""
+    vocab_bytes = sum(e * (8 + id_bytes) for e in summary["estimates"].values())
+    return max(int((device_bytes - vocab_bytes) * fraction), 64 * 1024 * 1024)
+
+
+# ----------------------------------------
+# Argument parsing and orchestration
+# ----------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="HyperLogLog cardinality sketch over Parquet categorical columns")
+    parser.add_argument("--data-dir", type=str, required=True, help="Folder containing Parquet files")
+    parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
+    parser.add_argument("--modulus", type=int, default=None, help="Hash modulus applied before sketching (default: none)")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION, help="HLL precision p (2^p registers)")
+    parser.add_argument("--n-jobs", type=int, default=8, help="Number of parallel jobs")
+    parser.add_argument("--memory-budget-gb", type=float, default=None, help="Memory budget for the vocab plan")
+    args = parser.parse_args()
+
+    file_list = list_parquet_files(args.data_dir, args.file_pattern)
+    print(f"Found {len(file_list)} files")
+
+    start_time = time.time()
+    results = Parallel(n_jobs=args.n_jobs)(
+        delayed(sketch_file)(file, SPARSE_COLUMNS, args.modulus, args.precision)
+        for file in tqdm(file_list, desc="Sketching files")
+    )
+
+    # HLL registers merge with an element-wise max
+    registers = {col: np.zeros(1 << args.precision, dtype=np.uint8) for col in SPARSE_COLUMNS}
+    num_rows = 0
+    for file_registers, file_rows in results:
+        num_rows += file_rows
+        for col in SPARSE_COLUMNS:
+            np.maximum(registers[col], file_registers[col], out=registers[col])
+
+    summary = save_cardinality_sketch(args.data_dir, registers, num_rows, len(file_list), args.modulus, args.precision)
+    print(f"Sketched {num_rows:,} rows in {time.time() - start_time:.2f} seconds")
+
+    budget = int(args.memory_budget_gb * 1024**3) if args.memory_budget_gb else None
+    plan = plan_vocab_tables(summary, budget)
+    for col, entry in plan.items():
+        print(f"{col}: ~{entry['estimate']:,} uniques -> {entry['structure']} "
+              f"({entry['bytes'] / 1024**2:.1f} MB){' [spill]' if entry['spill'] else ''}")
+    print(f"Saved sketch to {os.path.join(args.data_dir, SKETCH_FILE)}")
+
+if __name__ == "__main__":
+    main()
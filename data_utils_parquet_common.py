@@ -0,0 +1,201 @@
+import os
+import glob
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ----------------------------------------
+# Criteo column layout shared by the parquet pipelines
+# ----------------------------------------
+NUM_DENSE_FEATURES = 13
+NUM_SPARSE_FEATURES = 26
+
+LABEL_COLUMNS = ["col_0"]
+DENSE_COLUMNS = [f"col_{i}" for i in range(1, 1 + NUM_DENSE_FEATURES)]
+SPARSE_COLUMNS = [f"col_{i}" for i in range(1 + NUM_DENSE_FEATURES, 1 + NUM_DENSE_FEATURES + NUM_SPARSE_FEATURES)]
+
+# Lookup table from an ASCII byte to its hex nibble value ('0'-'9', 'a'-'f', 'A'-'F')
+HEX_NIBBLE_LUT = np.zeros(256, dtype=np.uint64)
+HEX_NIBBLE_LUT[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10, dtype=np.uint64)
+HEX_NIBBLE_LUT[np.frombuffer(b"abcdef", dtype=np.uint8)] = np.arange(10, 16, dtype=np.uint64)
+HEX_NIBBLE_LUT[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16, dtype=np.uint64)
+# And back: byte value -> its two upper-case ASCII hex digits as one little-endian uint16
+_HEX_DIGITS = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+HEX_PAIR_LUT = (_HEX_DIGITS[np.arange(256) >> 4].astype(np.uint16)
+                | (_HEX_DIGITS[np.arange(256) & 0xF].astype(np.uint16) << 8))
+
+
+def list_parquet_files(data_dir, file_pattern="*.parquet"):
+    """Sorted list of parquet files so that every pass sees the same file order."""
+    return sorted(glob.glob(os.path.join(data_dir, file_pattern)))
+
+
+def _string_chunk_to_bytes_matrix(chunk):
+    # Fast path: every string has the same length (e.g. the 8-char Criteo hex
+    # values), so the data buffer can be viewed as an (n, width) byte matrix.
+    n = len(chunk)
+    offset_dtype = np.int64 if pa.types.is_large_string(chunk.type) else np.int32
+    offsets = np.frombuffer(chunk.buffers()[1], dtype=offset_dtype)[chunk.offset:chunk.offset + n + 1]
+    lengths = np.diff(offsets)
+    if n > 0 and (lengths == lengths[0]).all() and lengths[0] > 0:
+        data = np.frombuffer(chunk.buffers()[2], dtype=np.uint8)
+        return data[offsets[0]:offsets[-1]].reshape(n, int(lengths[0])), True
+    # Variable-length strings are right-padded with NUL bytes
+    width = max(int(lengths.max()) if n > 0 else 1, 1)
+    matrix = np.asarray(chunk.to_numpy(zero_copy_only=False).astype(f"S{width}"))
+    return matrix.view(np.uint8).reshape(n, width), False
+
+
+def hex_to_int(array):
+    """Vectorized int(x, 16) for a pyarrow string array (up to 16 hex digits).
+
+    Nulls are decoded as 0, matching the FillMissing convention of the Beam pipelines.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        chunks = [hex_to_int(chunk) for chunk in array.chunks]
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint64)
+    if array.null_count:
+        array = array.fill_null("0")
+    matrix, fixed_width = _string_chunk_to_bytes_matrix(array)
+    values = np.zeros(matrix.shape[0], dtype=np.uint64)
+    for j in range(matrix.shape[1]):
+        column = matrix[:, j]
+        shifted = (values << np.uint64(4)) | HEX_NIBBLE_LUT[column]
+        values = shifted if fixed_width else np.where(column != 0, shifted, values)
+    return values
+
+
+def int_to_hex(values, width=8, nulls=None):
+    """Vectorized f"{x:0{width}X}" into a pyarrow string array (inverse of hex_to_int).
+
+    The big-endian bytes of each value are mapped to digit pairs through a
+    256-entry lookup table; the resulting (n, width) byte matrix becomes the
+    string data buffer as is. Rows set in the optional nulls mask are null.
+    """
+    n = len(values)
+    nbytes = (width + 1) // 2
+    big_endian = np.asarray(values).astype(">u4" if nbytes <= 4 else ">u8")
+    value_bytes = big_endian.view(np.uint8).reshape(n, big_endian.itemsize)[:, big_endian.itemsize - nbytes:]
+    chars = HEX_PAIR_LUT[value_bytes].view(np.uint8).reshape(n, 2 * nbytes)[:, 2 * nbytes - width:]
+    offsets = np.arange(0, n * width + 1, width, dtype=np.int32)
+    validity, null_count = None, 0
+    if nulls is not None and nulls.any():
+        validity = pa.py_buffer(np.packbits(~nulls, bitorder="little"))
+        null_count = int(np.count_nonzero(nulls))
+    return pa.StringArray.from_buffers(n, pa.py_buffer(offsets), pa.py_buffer(np.ascontiguousarray(chars)),
+                                       validity, null_count)
+
+
+def sparse_column_to_int(array, modulus=None):
+    """Decode a sparse column (hex strings or integers) to int64, optionally mod'ed.
+
+    Accepts pyarrow arrays, pandas Series and numpy arrays.
+    """
+    if not isinstance(array, (pa.Array, pa.ChunkedArray)):
+        array = pa.array(array)
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        values = hex_to_int(array)
+        if modulus is not None:
+            values = values % np.uint64(modulus)
+        return values.astype(np.int64)
+    # np.asarray: ChunkedArray.to_numpy takes no arguments on pyarrow 10
+    values = np.asarray(array.fill_null(0)).astype(np.int64)
+    if modulus is not None:
+        values = np.mod(values, modulus)
+    return values
+
+
+def iter_row_groups(parquet_file, columns=None, row_groups=None):
+    """Yield (row_group_index, pyarrow.Table) for each row group (or each of row_groups) of a parquet file."""
+    pf = pq.ParquetFile(parquet_file)
+    for rg in (range(pf.num_row_groups) if row_groups is None else row_groups):
+        yield rg, pf.read_row_group(rg, columns=columns)
+
+
+class BufferedParquetWriter:
+    """Single writer per output file that buffers batches into full row groups.
+
+    Small per-row-group tables are accumulated until row_group_size rows are
+    available, so the output has properly sized row groups regardless of the
+    input layout. With stats=True, per-row-group sketches and label counts are
+    computed from the same tables and stored in the footer key-value metadata
+    (parquet's own min/max/null statistics cover the rest). Stats are off by
+    default: only the ingest writers, whose outputs get planned from, turn
+    them on.
+    """
+
+    def __init__(self, path, schema=None, row_group_size=1000000, stats=False, label_columns=LABEL_COLUMNS, **writer_kwargs):
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.writer_kwargs = writer_kwargs
+        self.writer = None
+        self.buffer = []
+        self.buffered_rows = 0
+        self.num_rows = 0
+        self.stats = None
+        self.label_columns = label_columns if stats else None
+
+    def write_table(self, table):
+        if self.schema is None:
+            self.schema = table.schema
+        self.buffer.append(table)
+        self.buffered_rows += table.num_rows
+        if self.buffered_rows >= self.row_group_size:
+            self._flush(final=False)
+
+    def _flush(self, final):
+        if not self.buffer:
+            return
+        self._open_writer()
+        # A single buffered table (e.g. an input row group of exactly the target size) is written without a copy
+        combined = self.buffer[0] if len(self.buffer) == 1 else pa.concat_tables(self.buffer).combine_chunks()
+        # Only full row groups are written until the final flush
+        full = combined.num_rows if final else (combined.num_rows // self.row_group_size) * self.row_group_size
+        if full > 0:
+            self.writer.write_table(combined.slice(0, full), row_group_size=self.row_group_size)
+            if self.stats is not None:
+                for start in range(0, full, self.row_group_size):
+                    chunk = (self.num_rows + start) // self.row_group_size
+                    self.stats.update_table(chunk, combined.slice(start, min(self.row_group_size, full - start)))
+        rest = combined.slice(full)
+        self.buffer = [rest] if rest.num_rows else []
+        self.buffered_rows = rest.num_rows
+        self.num_rows += full
+
+    def _open_writer(self):
+        if self.writer is not None:
+            return
+        self.writer = pq.ParquetWriter(self.path, self.schema, **self.writer_kwargs)
+        if self.label_columns is not None:
+            # Imported here: the stats module itself builds on this one
+            from data_utils_column_stats import StatsCollector
+            self.stats = StatsCollector(self.schema.names, self.label_columns)
+
+    def close(self):
+        self._flush(final=True)
+        if self.writer is None and self.schema is not None:
+            # Still produce a valid (empty) file
+            self._open_writer()
+        if self.writer is not None:
+            if self.stats is not None:
+                from data_utils_column_stats import attach_parquet_stats
+                attach_parquet_stats(self.writer, self.path, self.stats.to_dict())
+            self.writer.close()
+
+    def abort(self):
+        """Drop buffered rows and remove the partial output, so a failed run leaves no valid-looking file."""
+        self.buffer = []
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,94 @@
+import os
+import time
+import argparse
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+
+from data_utils_parquet_common import list_parquet_files, iter_row_groups, BufferedParquetWriter
+
+# ----------------------------------------
+# Streaming parquet compactor
+#
+# Consecutive input files are grouped into outputs (a fixed number of files per
+# output, or up to a target output size; the last group takes the remainder).
+# Each output streams its inputs' row groups through one BufferedParquetWriter,
+# so memory is about one output row group, and outputs are written in parallel.
+#
+# When an input's schema matches the output schema and its row groups already
+# have the target size, its row groups go to the writer unchanged (no
+# concatenation, no cast). The input's compression codec is kept unless
+# another is requested.
+# ----------------------------------------
+def plan_groups(file_list, files_per_group=None, target_bytes=None):
+    """Split file_list into consecutive groups by file count or by cumulative file size."""
+    if files_per_group:
+        return [file_list[i:i + files_per_group] for i in range(0, len(file_list), files_per_group)]
+    if not target_bytes:
+        return [file_list] if file_list else []
+    groups, current, current_bytes = [], [], 0
+    for file in file_list:
+        size = os.path.getsize(file)
+        if current and current_bytes + size > target_bytes:
+            groups.append(current)
+            current, current_bytes = [], 0
+        current.append(file)
+        current_bytes += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def input_compression(parquet_file):
+    """Compression codec of the first column chunk (None for uncompressed or empty files)."""
+    metadata = pq.ParquetFile(parquet_file).metadata
+    if metadata.num_row_groups == 0 or metadata.num_columns == 0:
+        return None
+    codec = metadata.row_group(0).column(0).compression
+    return None if codec == "UNCOMPRESSED" else codec.lower()
+
+
+def compact_group(input_files, output_file, row_group_size=3_000_000, compression="keep"):
+    """Stream input_files into output_file with row groups of row_group_size rows."""
+    schema = pq.ParquetFile(input_files[0]).schema_arrow
+    if compression == "keep":
+        compression = input_compression(input_files[0])
+    with BufferedParquetWriter(output_file, schema, row_group_size, compression=compression) as writer:
+        for file in input_files:
+            same_schema = pq.ParquetFile(file).schema_arrow.equals(schema)
+            for _, table in iter_row_groups(file):
+                writer.write_table(table if same_schema else table.cast(schema))
+    return output_file, writer.num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact many parquet files into fewer, larger ones (streaming)")
+    parser.add_argument("--input-dir", type=str, required=True, help="Folder containing Parquet files")
+    parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
+    parser.add_argument("--output-dir", type=str, required=True, help="Folder for the compacted files")
+    parser.add_argument("--output-prefix", type=str, default="combined_part", help="Output file name prefix")
+    parser.add_argument("--files-per-group", type=int, default=None, help="Input files per output file")
+    parser.add_argument("--target-size-mb", type=int, default=None, help="Approximate output size (instead of --files-per-group)")
+    parser.add_argument("--row-group-size", type=int, default=3_000_000, help="Rows per output row group")
+    parser.add_argument("--compression", type=str, default="keep", help="Output codec ('keep' = same as input, 'none')")
+    parser.add_argument("--n-jobs", type=int, default=4, help="Output files written in parallel")
+    args = parser.parse_args()
+
+    file_list = list_parquet_files(args.input_dir, args.file_pattern)
+    groups = plan_groups(file_list, args.files_per_group,
+                         args.target_size_mb * 1024**2 if args.target_size_mb else None)
+    compression = None if args.compression == "none" else args.compression
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"Compacting {len(file_list)} files into {len(groups)} outputs (row group size {args.row_group_size:,})")
+
+    start_time = time.time()
+    results = Parallel(n_jobs=args.n_jobs)(
+        delayed(compact_group)(group, os.path.join(args.output_dir, f"{args.output_prefix}_{i}.parquet"),
+                               args.row_group_size, compression)
+        for i, group in enumerate(groups)
+    )
+    for output_file, num_rows in results:
+        print(f"Written: {output_file} ({num_rows:,} rows)")
+    print(f"Compaction finished in {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed, effective_n_jobs
+
+from data_utils_parquet_common import list_parquet_files, iter_row_groups, BufferedParquetWriter
+from data_utils_parquet_compactor import input_compression
+
+# ----------------------------------------
+# Out-of-core global shuffle for sharded parquet datasets
+#
+# The two-pass FYR shuffle of concatCriteoAdData (data_utils.py) for parquet
+# parts, with vectorized bucket assignment:
+#
+# 1st pass  every input row goes to one of K buckets, uniformly at random
+#           subject to bucket capacities (total rows / K each). Per-file bucket
+#           counts are drawn up front from a multivariate hypergeometric over
+#           the remaining capacities (footers only), then split per row group
+#           the same way, so no row ever has to be redrawn. Files are scattered
+#           in parallel. Each worker copies its rows into per-bucket buffers and,
+#           whenever they reach memory_budget_bytes, spills all of them as one
+#           run: an Arrow IPC file with one record batch per non-empty bucket
+#           (bucket ids in the schema metadata). So a worker holds at most the
+#           budget plus one input row group, and one open file.
+# 2nd pass  every bucket reads its batches from all runs (one file open at a
+#           time), is permuted in memory and written as output shard k, buckets in
+#           parallel. Peak memory is about n_jobs buckets.
+#
+# All draws come from SeedSequence([seed, pass, index]), and runs are read back
+# in (worker, run) order, i.e. input file order, so the output depends only on
+# the inputs, num_buckets and seed (not on n_jobs, the budget or timing).
+# ----------------------------------------
+TMP_DIR = "_shuffle_tmp"
+SCATTER_MEMORY_BUDGET = 1 << 30
+RUN_BUCKETS_KEY = b"rec_preprocessing.shuffle_buckets"
+RUN_COMPRESSION = "lz4"
+
+
+def _rng(seed, stage, index):
+    return np.random.default_rng(np.random.SeedSequence([seed, stage, index]))
+
+
+def plan_bucket_counts(file_rows, num_buckets, seed=0):
+    """counts[i, k]: rows of input file i that go to bucket k; bucket k holds total // K (+1) rows."""
+    base, extra = divmod(int(sum(file_rows)), num_buckets)
+    remaining = np.full(num_buckets, base, dtype=np.int64)
+    remaining[:extra] += 1
+    rng = _rng(seed, 0, 0)
+    counts = np.zeros((len(file_rows), num_buckets), dtype=np.int64)
+    for i, rows in enumerate(file_rows):
+        counts[i] = rng.multivariate_hypergeometric(remaining, rows)
+        remaining -= counts[i]
+    return counts
+
+
+def write_run(path, schema, buffers):
+    """Spill per-bucket buffers ({bucket: [tables]}) as one IPC run, one record batch per bucket."""
+    buckets = sorted(buffers)
+    run_schema = schema.with_metadata({**(schema.metadata or {}), RUN_BUCKETS_KEY: json.dumps(buckets).encode()})
+    options = pa.ipc.IpcWriteOptions(compression=RUN_COMPRESSION)
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, run_schema, options=options) as writer:
+        for k in buckets:
+            writer.write_table(pa.concat_tables(buffers[k]).combine_chunks(), max_chunksize=None)
+
+
+def scatter_files(worker, files, file_indices, counts, tmp_dir, schema, seed=0,
+                  memory_budget_bytes=SCATTER_MEMORY_BUDGET):
+    """1st pass for one worker: split every row group of its files over the buckets, spilling runs."""
+    num_buckets = counts.shape[1]
+    buffers, buffered_bytes, runs = {}, 0, []
+    for file, i in zip(files, file_indices):
+        rng = _rng(seed, 1, i)
+        remaining = counts[i].copy()
+        same_schema = pq.ParquetFile(file).schema_arrow.equals(schema)
+        for _, table in iter_row_groups(file):
+            if not same_schema:
+                table = table.cast(schema)
+            rg_counts = rng.multivariate_hypergeometric(remaining, table.num_rows)
+            remaining -= rg_counts
+            # Random bucket per row, then rows grouped by bucket (input order kept within a bucket)
+            assignment = rng.permutation(np.repeat(np.arange(num_buckets), rg_counts))
+            # One take copies the rows in bucket order (so the input row group is not kept
+            # alive); every bucket's run is then a zero-copy slice of that copy
+            grouped = table.take(np.argsort(assignment, kind="stable"))
+            bounds = np.concatenate([[0], np.cumsum(rg_counts)])
+            for k in np.flatnonzero(rg_counts):
+                buffers.setdefault(int(k), []).append(grouped.slice(bounds[k], rg_counts[k]))
+            # Counted once: slices report their parent's buffers on older pyarrow
+            buffered_bytes += grouped.nbytes
+            if buffered_bytes >= memory_budget_bytes:
+                runs.append(os.path.join(tmp_dir, f"run_{worker:04d}_{len(runs):05d}.arrow"))
+                write_run(runs[-1], schema, buffers)
+                buffers, buffered_bytes = {}, 0
+    if buffers:
+        runs.append(os.path.join(tmp_dir, f"run_{worker:04d}_{len(runs):05d}.arrow"))
+        write_run(runs[-1], schema, buffers)
+    return runs
+
+
+def index_runs(runs, num_buckets):
+    """(run path, batch index) of every piece of every bucket, in run order."""
+    pieces = [[] for _ in range(num_buckets)]
+    for path in runs:
+        with pa.OSFile(path, "rb") as source:
+            buckets = json.loads(pa.ipc.open_file(source).schema.metadata[RUN_BUCKETS_KEY])
+        for batch_index, k in enumerate(buckets):
+            pieces[k].append((path, batch_index))
+    return pieces
+
+
+def shuffle_bucket(pieces, schema, output_file, bucket, seed=0, row_group_size=1000000, compression=None):
+    """2nd pass for one bucket: gather its batches from the runs, permute the rows, write the shard."""
+    batches = []
+    for path, i in pieces:
+        # OSFile reads copy the batch, so no run stays open (or mapped) afterwards
+        with pa.OSFile(path, "rb") as source:
+            batches.append(pa.ipc.open_file(source).get_batch(i).replace_schema_metadata(schema.metadata))
+    table = pa.Table.from_batches(batches, schema=schema)
+    table = table.take(_rng(seed, 2, bucket).permutation(table.num_rows))
+    with BufferedParquetWriter(output_file, schema, row_group_size, compression=compression) as writer:
+        writer.write_table(table)
+    return output_file, table.num_rows
+
+
+def global_shuffle(input_files, output_dir, num_buckets=None, seed=0, n_jobs=8, row_group_size=1000000,
+                   output_prefix="shuffled_part", compression="keep", keep_tmp=False,
+                   memory_budget_bytes=SCATTER_MEMORY_BUDGET):
+    """Globally shuffle input_files into num_buckets parquet shards (default: one per input)."""
+    num_buckets = num_buckets or len(input_files)
+    schema = pq.ParquetFile(input_files[0]).schema_arrow
+    if compression == "keep":
+        compression = input_compression(input_files[0])
+    file_rows = [pq.ParquetFile(f).metadata.num_rows for f in input_files]
+    counts = plan_bucket_counts(file_rows, num_buckets, seed)
+
+    tmp_dir = os.path.join(output_dir, TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    # Contiguous file ranges per worker, so runs concatenate back in input order
+    num_workers = min(effective_n_jobs(n_jobs), len(input_files))
+    workers = [w for w in np.array_split(np.arange(len(input_files)), num_workers) if len(w)]
+    start_time = time.time()
+    worker_runs = Parallel(n_jobs=n_jobs)(
+        delayed(scatter_files)(w, [input_files[i] for i in indices], indices, counts, tmp_dir, schema, seed,
+                               memory_budget_bytes)
+        for w, indices in enumerate(workers)
+    )
+    runs = [path for paths in worker_runs for path in paths]
+    print(f"1st pass (scatter into {num_buckets} buckets, {len(runs)} runs) finished in "
+          f"{time.time() - start_time:.2f} seconds")
+
+    start_time = time.time()
+    pieces = index_runs(runs, num_buckets)
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(shuffle_bucket)(pieces[k], schema, os.path.join(output_dir, f"{output_prefix}_{k:04d}.parquet"),
+                                k, seed, row_group_size, compression)
+        for k in range(num_buckets)
+    )
+    print(f"2nd pass (permute buckets) finished in {time.time() - start_time:.2f} seconds")
+    if not keep_tmp:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Out-of-core global shuffle of a sharded parquet dataset")
+    parser.add_argument("--input-dir", type=str, required=True, help="Folder containing Parquet files")
+    parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
+    parser.add_argument("--output-dir", type=str, required=True, help="Folder for the shuffled shards")
+    parser.add_argument("--output-prefix", type=str, default="shuffled_part", help="Output file name prefix")
+    parser.add_argument("--num-buckets", type=int, default=None, help="Buckets = output shards (default: number of inputs)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed; the same seed gives the same output")
+    parser.add_argument("--row-group-size", type=int, default=1000000, help="Rows per output row group")
+    parser.add_argument("--compression", type=str, default="keep", help="Output codec ('keep' = same as input, 'none')")
+    parser.add_argument("--n-jobs", type=int, default=8, help="Parallel workers (2nd pass holds one bucket each)")
+    parser.add_argument("--memory-budget-mb", type=int, default=SCATTER_MEMORY_BUDGET >> 20,
+                        help="1st pass buffer per worker before spilling a run (MB)")
+    parser.add_argument("--keep-tmp", action="store_true", help="Keep the 1st pass run files")
+    args = parser.parse_args()
+
+    input_files = list_parquet_files(args.input_dir, args.file_pattern)
+    if not input_files:
+        raise SystemExit(f"No files match {args.file_pattern} in {args.input_dir}")
+    os.makedirs(args.output_dir, exist_ok=True)
+    compression = None if args.compression == "none" else args.compression
+    print(f"Shuffling {len(input_files)} files into {args.num_buckets or len(input_files)} shards (seed {args.seed})")
+
+    start_time = time.time()
+    results = global_shuffle(input_files, args.output_dir, args.num_buckets, args.seed, args.n_jobs,
+                             args.row_group_size, args.output_prefix, compression, args.keep_tmp,
+                             args.memory_budget_mb << 20)
+    total_rows = sum(num_rows for _, num_rows in results)
+    print(f"Shuffled {total_rows:,} rows in {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+
+from data_utils_parquet_common import (SPARSE_COLUMNS, list_parquet_files, sparse_column_to_int,
+                                       iter_row_groups, BufferedParquetWriter)
+
+LAYOUT_KEY = b"rec_preprocessing.layout"
+
+# ----------------------------------------
+# Parquet layout optimizer
+#
+# 1. sample:    the first --sample-rows rows of the dataset
+# 2. benchmark: write the sample in every candidate layout (row group size x
+#               compression x dictionary encoding of sparse columns x hex-string
+#               or int64 sparse storage), drop it from the page cache and time
+#               the pipelines' read pattern: every column read on its own, one
+#               row group at a time, sparse columns decoded to int64
+# 3. rewrite:   stream every file into the fastest layout (ties -> smaller
+#               file) and record the settings in the footer key-value metadata
+# ----------------------------------------
+DEFAULT_ROW_GROUP_SIZES = [100_000, 1_000_000, 3_000_000]
+DEFAULT_COMPRESSIONS = ["none", "snappy", "zstd"]
+
+
+def candidate_layouts(row_group_sizes, compressions, dictionaries=(True, False), sparse_types=("string", "int64")):
+    return [{"row_group_size": rg, "compression": compression, "dictionary": dictionary, "sparse_type": sparse_type}
+            for rg, compression, dictionary, sparse_type
+            in itertools.product(row_group_sizes, compressions, dictionaries, sparse_types)]
+
+
+def sample_table(file_list, sample_rows):
+    """First sample_rows rows of the dataset, read one row group at a time."""
+    tables, rows = [], 0
+    for file in file_list:
+        for _, table in iter_row_groups(file):
+            tables.append(table.slice(0, sample_rows - rows))
+            rows += tables[-1].num_rows
+            if rows >= sample_rows:
+                return pa.concat_tables(tables)
+    if not tables:
+        raise ValueError("No rows to sample")
+    return pa.concat_tables(tables)
+
+
+def apply_sparse_type(table, sparse_columns, sparse_type):
+    """Store hex-string sparse columns as int64 (nulls kept) when sparse_type is "int64"."""
+    if sparse_type != "int64":
+        return table
+    for name in sparse_columns:
+        array = table.column(name)
+        if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            mask = np.asarray(array.is_null()) if array.null_count else None
+            table = table.set_column(table.schema.get_field_index(name), name,
+                                     pa.array(sparse_column_to_int(array), mask=mask))
+    return table
+
+
+def layout_writer_kwargs(layout, sparse_columns):
+    return {
+        "compression": None if layout["compression"] == "none" else layout["compression"],
+        "use_dictionary": list(sparse_columns) if layout["dictionary"] else False,
+    }
+
+
+def _drop_page_cache(path):
+    # Benchmark cold reads: flush the file and evict it from the page cache
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def time_read_pattern(path, columns, sparse_columns):
+    """Seconds to read every column on its own, row group by row group, decoding sparse columns to int64."""
+    pf = pq.ParquetFile(path)
+    start = time.perf_counter()
+    for column in columns:
+        for rg in range(pf.num_row_groups):
+            array = pf.read_row_group(rg, columns=[column]).column(0)
+            if column in sparse_columns:
+                sparse_column_to_int(array)
+            else:
+                array.to_numpy()
+    return time.perf_counter() - start
+
+
+def benchmark_layouts(sample, layouts, sparse_columns, work_dir, repeats=1):
+    results = []
+    for i, layout in enumerate(layouts):
+        path = os.path.join(work_dir, f"candidate_{i}.parquet")
+        table = apply_sparse_type(sample, sparse_columns, layout["sparse_type"])
+        pq.write_table(table, path, row_group_size=layout["row_group_size"],
+                       **layout_writer_kwargs(layout, sparse_columns))
+        seconds = []
+        for _ in range(repeats):
+            _drop_page_cache(path)
+            seconds.append(time_read_pattern(path, sample.column_names, sparse_columns))
+        results.append(dict(layout, read_seconds=min(seconds), file_bytes=os.path.getsize(path)))
+        os.remove(path)
+        print(f"  {layout} -> {results[-1]['read_seconds']:.3f}s, {results[-1]['file_bytes'] / 1024**2:.1f} MB")
+    return results
+
+
+def choose_layout(results, tolerance=0.05):
+    """Fastest layout; among layouts within tolerance of it, the smallest file."""
+    fastest = min(r["read_seconds"] for r in results)
+    close = [r for r in results if r["read_seconds"] <= fastest * (1 + tolerance)]
+    return min(close, key=lambda r: r["file_bytes"])
+
+
+def rewrite_file(input_file, output_file, layout, sparse_columns):
+    """Stream one file into the chosen layout, row group by row group."""
+    pf = pq.ParquetFile(input_file)
+    schema = apply_sparse_type(pf.schema_arrow.empty_table(), sparse_columns, layout["sparse_type"]).schema
+    settings = {key: layout[key] for key in ("row_group_size", "compression", "dictionary", "sparse_type")}
+    schema = schema.with_metadata({**(schema.metadata or {}), LAYOUT_KEY: json.dumps(settings).encode()})
+    with BufferedParquetWriter(output_file, schema, layout["row_group_size"],
+                               **layout_writer_kwargs(layout, sparse_columns)) as writer:
+        for _, table in iter_row_groups(input_file):
+            writer.write_table(apply_sparse_type(table, sparse_columns, layout["sparse_type"]).cast(schema))
+    return output_file
+
+
+def load_layout(path):
+    """Layout settings recorded by the optimizer, or None."""
+    metadata = pq.ParquetFile(path).schema_arrow.metadata or {}
+    return json.loads(metadata[LAYOUT_KEY]) if LAYOUT_KEY in metadata else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parquet layouts on a sample and rewrite the dataset in the fastest")
+    parser.add_argument("--data-dir", type=str, required=True, help="Folder containing Parquet files")
+    parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
+    parser.add_argument("--output-dir", type=str, default=None, help="Rewrite the dataset here (default: benchmark only)")
+    parser.add_argument("--sample-rows", type=int, default=3_000_000, help="Rows benchmarked per candidate")
+    parser.add_argument("--row-group-sizes", type=str, default=",".join(map(str, DEFAULT_ROW_GROUP_SIZES)))
+    parser.add_argument("--compressions", type=str, default=",".join(DEFAULT_COMPRESSIONS))
+    parser.add_argument("--repeats", type=int, default=1, help="Timed reads per candidate (best is kept)")
+    parser.add_argument("--work-dir", type=str, default=None, help="Scratch space for candidates (same disk as the data)")
+    parser.add_argument("--n-jobs", type=int, default=8, help="Files rewritten in parallel")
+    args = parser.parse_args()
+
+    file_list = list_parquet_files(args.data_dir, args.file_pattern)
+    print(f"Found {len(file_list)} files")
+    sample = sample_table(file_list, args.sample_rows)
+    sparse_columns = [name for name in sample.column_names if name in SPARSE_COLUMNS]
+    layouts = candidate_layouts([int(x) for x in args.row_group_sizes.split(",")], args.compressions.split(","))
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="layout_", dir=args.work_dir or args.output_dir or args.data_dir)
+    try:
+        print(f"Benchmarking {len(layouts)} layouts on {sample.num_rows:,} rows")
+        results = benchmark_layouts(sample, layouts, sparse_columns, work_dir, args.repeats)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    best = choose_layout(results)
+    print(f"Chosen layout: {best}")
+
+    if args.output_dir:
+        start_time = time.time()
+        Parallel(n_jobs=args.n_jobs)(
+            delayed(rewrite_file)(file, os.path.join(args.output_dir, os.path.basename(file)), best, sparse_columns)
+            for file in file_list
+        )
+        print(f"Rewrote {len(file_list)} files in {time.time() - start_time:.2f} seconds")
+        with open(os.path.join(args.output_dir, "layout.json"), "w") as f:
+            json.dump({"chosen": best, "candidates": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
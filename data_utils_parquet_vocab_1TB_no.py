@@ -1,54 +1,184 @@
 import os
 import glob
-import json
 import argparse
-import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
-from collections import defaultdict
 from joblib import Parallel, delayed
 
+from data_utils_parquet_common import sparse_column_to_int, iter_row_groups, BufferedParquetWriter
+from data_utils_vocab_counts import count_values, merge_counts, select_vocab
+from data_utils_vocab_artifact import save_vocab_artifact, load_vocab_artifact
+from data_utils_parquet_cardinality_sketch import load_cardinality_estimates, plan_vocab_tables
+
 # ----------------------------------------
-# Step 1: Collect unique categorical values
+# Step 1: Collect unique categorical values (parallel map-reduce)
 # ----------------------------------------
-def collect_unique_values(file_list, columns_pipeline_2, modulus):
-    global_uniques = defaultdict(set)
+def _load_part(part):
+    # Spilled partitions are passed around as .npy paths and read back memory-mapped
+    return np.load(part, mmap_mode="r") if isinstance(part, str) else part
+
+
+def _maybe_spill(values, spill_dir, memory_budget_bytes, tag):
+    if spill_dir is None or values.nbytes <= memory_budget_bytes:
+        return values
+    os.makedirs(spill_dir, exist_ok=True)
+    path = os.path.join(spill_dir, f"{tag}.npy")
+    np.save(path, values)
+    return path
 
-    for file in tqdm(file_list, desc="Collecting unique values"):
-        for col in columns_pipeline_2:
-            df = pd.read_parquet(file, columns=[col])
-            modded_values = df[col].dropna().apply(
-                lambda x: int(x, 16) % modulus if isinstance(x, str) else x % modulus
-            )
-            global_uniques[col].update(modded_values.unique())
 
-    return global_uniques
+def map_file_uniques(file, columns_pipeline_2, modulus, spill_dir, memory_budget_bytes, dense_columns=()):
+    """Map phase: sorted unique int64 array per column of one file.
+
+    dense_columns (planned as "dense_lut" from the cardinality sketch) mark seen
+    keys in a bitmap over [0, modulus) instead of merging sorted arrays.
+    """
+    uniques = {}
+    seen = {col: np.zeros(modulus, dtype=bool) for col in dense_columns}
+    for _, table in iter_row_groups(file, columns=columns_pipeline_2):
+        for col in columns_pipeline_2:
+            values = sparse_column_to_int(table.column(col).drop_null(), modulus)
+            if col in seen:
+                seen[col][values] = True
+                continue
+            values = np.unique(values)
+            uniques[col] = np.union1d(uniques[col], values) if col in uniques else values
+    uniques.update({col: np.flatnonzero(bitmap).astype(np.int64) for col, bitmap in seen.items()})
+    tag = os.path.basename(file).replace(".parquet", "")
+    return {col: _maybe_spill(values, spill_dir, memory_budget_bytes, f"{tag}_{col}")
+            for col, values in uniques.items()}
+
+
+def merge_sorted_uniques(left, right, spill_dir, memory_budget_bytes, tag):
+    """Reduce phase: union of two sorted unique arrays."""
+    merged = np.union1d(_load_part(left), _load_part(right))
+    return _maybe_spill(merged, spill_dir, memory_budget_bytes, tag)
+
+
+def tree_reduce(parts, merge_fn, n_jobs, spill_dir, memory_budget_bytes, name):
+    """Pairwise tree of merge_fn over each column's partitions, all columns of a level in parallel.
+
+    The pairing only depends on the file order, so the result does not depend on n_jobs.
+    """
+    level = 0
+    while any(len(p) > 1 for p in parts.values()):
+        tasks, slots = [], []
+        for col, col_parts in parts.items():
+            for i in range(0, len(col_parts) - 1, 2):
+                tag = f"{name}_{col}_l{level}_{i // 2}"
+                tasks.append(delayed(merge_fn)(col_parts[i], col_parts[i + 1], spill_dir, memory_budget_bytes, tag))
+                slots.append(col)
+        merged = Parallel(n_jobs=n_jobs)(tasks)
+        next_parts = {col: [] for col in parts}
+        for col, part in zip(slots, merged):
+            next_parts[col].append(part)
+        for col, col_parts in parts.items():
+            if len(col_parts) % 2 == 1:
+                next_parts[col].append(col_parts[-1])
+        parts = next_parts
+        level += 1
+    return parts
+
+
+def collect_unique_values(file_list, columns_pipeline_2, modulus, n_jobs=8,
+                          memory_budget_bytes=1 << 30, spill_dir=None, dense_columns=()):
+    # Map: one task per file, every column decoded vectorized per row group
+    mapped = Parallel(n_jobs=n_jobs)(
+        delayed(map_file_uniques)(file, columns_pipeline_2, modulus, spill_dir, memory_budget_bytes, dense_columns)
+        for file in tqdm(file_list, desc="Collecting unique values")
+    )
+    parts = {col: [m[col] for m in mapped if col in m] for col in columns_pipeline_2}
+
+    # Reduce: sorted-array unions
+    parts = tree_reduce(parts, merge_sorted_uniques, n_jobs, spill_dir, memory_budget_bytes, "merge")
+    return {col: _load_part(p[0]) if p else np.zeros(0, dtype=np.int64) for col, p in parts.items()}
 
 
 # ----------------------------------------
-# Step 2: Build global vocab mapping
+# Step 1 (thresholded): Count categorical values for min_count / top_k vocabularies
 # ----------------------------------------
-def build_global_mappings(global_uniques):
-    mappings = {}
-    for col, values in global_uniques.items():
-        sorted_unique = sorted(values)
-        mappings[col] = {val: idx for idx, val in enumerate(sorted_unique)}
-    return mappings
+def map_file_counts(file, columns_pipeline_2, modulus, spill_dir, memory_budget_bytes):
+    """Map phase: partial counts per column of one file (bincount or sorted runs)."""
+    counts = {}
+    for _, table in iter_row_groups(file, columns=columns_pipeline_2):
+        for col in columns_pipeline_2:
+            partial = count_values(sparse_column_to_int(table.column(col).drop_null(), modulus), modulus)
+            counts[col] = merge_counts(counts[col], partial) if col in counts else partial
+    tag = os.path.basename(file).replace(".parquet", "")
+    return {col: _maybe_spill(c, spill_dir, memory_budget_bytes, f"{tag}_{col}_counts")
+            for col, c in counts.items()}
+
+
+def merge_partial_counts(left, right, spill_dir, memory_budget_bytes, tag):
+    """Reduce phase: sum of two partial counts."""
+    merged = merge_counts(np.asarray(_load_part(left)), np.asarray(_load_part(right)))
+    return _maybe_spill(merged, spill_dir, memory_budget_bytes, tag)
+
+
+def collect_frequent_values(file_list, columns_pipeline_2, modulus, min_count=1, top_k=None, n_jobs=8,
+                            memory_budget_bytes=1 << 30, spill_dir=None):
+    mapped = Parallel(n_jobs=n_jobs)(
+        delayed(map_file_counts)(file, columns_pipeline_2, modulus, spill_dir, memory_budget_bytes)
+        for file in tqdm(file_list, desc="Counting values")
+    )
+    parts = {col: [m[col] for m in mapped if col in m] for col in columns_pipeline_2}
+    parts = tree_reduce(parts, merge_partial_counts, n_jobs, spill_dir, memory_budget_bytes, "counts")
+    return {col: select_vocab(np.asarray(_load_part(p[0])), min_count, top_k) if p else np.zeros(0, dtype=np.int64)
+            for col, p in parts.items()}
 
 
 # ----------------------------------------
-# Step 3: Process and transform columns
+# Step 2: Process and transform columns
 # ----------------------------------------
-def process_column_with_mapping(file, column, mapping, output_dir):
-    df = pd.read_parquet(file, columns=[column])
-    df[column] = df[column].apply(lambda x: int(x, 16) if isinstance(x, str) else x)
-    df[column] = df[column].map(lambda x: mapping.get(x % len(mapping), -1))
+def process_file_with_mapping(file, columns_pipeline_2, vocab_dir, output_dir,
+                              row_group_size=1000000, row_group_range=None, lut_columns=()):
+    """Transform every sparse column of a file (or a row-group range of it) into one output.
+
+    Label and dense columns are carried through unchanged, so the output is a
+    complete, properly row-grouped parquet file written by a single writer.
+    lut_columns are looked up through a direct table instead of searchsorted.
+    """
+    # Memory-mapped vocab: opening it costs the same for 8K or 500M entries
+    vocabs = load_vocab_artifact(vocab_dir, columns=columns_pipeline_2)
 
-    # Save output per column per file (optional format)
     os.makedirs(output_dir, exist_ok=True)
-    base = os.path.basename(file).replace(".parquet", f"_{column}.parquet")
-    out_path = os.path.join(output_dir, base)
-    df.to_parquet(out_path, index=False)
+    suffix = "_categorified.parquet"
+    if row_group_range is not None:
+        suffix = f"_rg{row_group_range[0]:04d}-{row_group_range[1] - 1:04d}" + suffix
+    out_path = os.path.join(output_dir, os.path.basename(file).replace(".parquet", suffix))
+
+    # Only the row groups of this task are read (the file is opened once)
+    row_groups = range(*row_group_range) if row_group_range is not None else None
+    with BufferedParquetWriter(out_path, row_group_size=row_group_size) as writer:
+        for _, table in iter_row_groups(file, row_groups=row_groups):
+            for col in columns_pipeline_2:
+                vocab = vocabs[col]
+                # Values cut by min_count / top_k share the OOV bucket
+                default = vocab.oov_id if vocab.oov_id is not None else -1
+                column = table.column(col)
+                ids = vocab.lookup(sparse_column_to_int(column, vocab.modulus), default=default,
+                                   use_lut=col in lut_columns)
+                if column.null_count:
+                    # Missing values map to -1 (as with the JSON mapping), not to the ID of key 0
+                    ids[np.asarray(column.is_null())] = -1
+                table = table.set_column(table.schema.get_field_index(col), col, pa.array(ids))
+            writer.write_table(table)
+    return out_path
+
+
+def plan_output_tasks(file_list, row_groups_per_output=None):
+    """(file, row_group_range) per output; whole files unless row_groups_per_output is set."""
+    tasks = []
+    for file in file_list:
+        if row_groups_per_output is None:
+            tasks.append((file, None))
+            continue
+        num_row_groups = pq.ParquetFile(file).num_row_groups
+        for start in range(0, num_row_groups, row_groups_per_output):
+            tasks.append((file, (start, min(start + row_groups_per_output, num_row_groups))))
+    return tasks
 
 # ----------------------------------------
 # Argument parsing and orchestration
@@ -59,8 +189,14 @@ def main():
     parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
     parser.add_argument("--modulus", type=int, default=8192, help="Hash modulus for categorical values")
     parser.add_argument("--n-jobs", type=int, default=8, help="Number of parallel jobs")
-    parser.add_argument("--output-dir", type=str, required=True, help="Folder to write processed columns")
-    parser.add_argument("--save-vocab", type=str, default="vocab_mapping.json", help="File to save vocab mapping")
+    parser.add_argument("--output-dir", type=str, required=True, help="Folder to write processed files")
+    parser.add_argument("--row-group-size", type=int, default=1000000, help="Rows per row group in the output files")
+    parser.add_argument("--row-groups-per-output", type=int, default=None, help="Split each input into outputs of this many input row groups (default: one output per file)")
+    parser.add_argument("--memory-budget-mb", type=int, default=1024, help="Spill a column's uniques to disk above this size")
+    parser.add_argument("--spill-dir", type=str, default=None, help="Folder for spilled unique partitions (default: no spilling)")
+    parser.add_argument("--min-count", type=int, default=1, help="Drop values seen fewer times than this into the OOV bucket")
+    parser.add_argument("--top-k", type=int, default=None, help="Keep only the k most frequent values per column")
+    parser.add_argument("--save-vocab", type=str, default="vocab_artifact", help="Folder to save the vocab artifact (.npy per column + manifest)")
 
     args = parser.parse_args()
 
@@ -68,25 +204,39 @@ def main():
     columns_pipeline_2 = [f"col_{i}" for i in range(14, 40)]
 
     # List files
-    file_list = glob.glob(os.path.join(args.data_dir, args.file_pattern))
+    file_list = sorted(glob.glob(os.path.join(args.data_dir, args.file_pattern)))
     print(f"Found {len(file_list)} files")
 
-    # Step 1: Collect all unique values
-    global_uniques = collect_unique_values(file_list, columns_pipeline_2, args.modulus)
-
-    # Step 2: Build vocab mapping
-    vocab_mapping = build_global_mappings(global_uniques, args.modulus)
-
-    # Save vocab mapping
-    with open(args.save_vocab, "w") as f:
-        json.dump({col: {str(k): v for k, v in mapping.items()} for col, mapping in vocab_mapping.items()}, f)
-    print(f"Saved vocab mapping to {args.save_vocab}")
-
-    # Step 3: Apply mapping in parallel
+    # With a cardinality sketch of this dataset, columns whose domain is small next to
+    # their estimated vocab use a bitmap to collect and a direct table to look up
+    dense_columns = set()
+    sketch = load_cardinality_estimates(args.data_dir)
+    if sketch is not None:
+        plan = plan_vocab_tables({**sketch, "modulus": args.modulus})
+        dense_columns = {col for col in columns_pipeline_2 if plan.get(col, {}).get("structure") == "dense_lut"}
+        total_mb = sum(entry["bytes"] for entry in plan.values()) / 1024**2
+        print(f"Cardinality sketch: ~{sum(sketch['estimates'].values()):,} total uniques, ~{total_mb:.1f} MB of vocab tables, "
+              f"{len(dense_columns)} columns as dense lookup tables")
+
+    # Step 1: Collect all unique values, or the frequent ones when thresholds are set
+    thresholded = args.min_count > 1 or args.top_k is not None
+    if thresholded:
+        global_uniques = collect_frequent_values(file_list, columns_pipeline_2, args.modulus, args.min_count, args.top_k,
+                                                 args.n_jobs, args.memory_budget_mb * 1024**2, args.spill_dir)
+    else:
+        global_uniques = collect_unique_values(file_list, columns_pipeline_2, args.modulus, args.n_jobs,
+                                               args.memory_budget_mb * 1024**2, args.spill_dir, dense_columns)
+
+    # Save vocab: the sorted uniques are the vocabulary, ID = position (OOV = size)
+    save_vocab_artifact(args.save_vocab, global_uniques, modulus=args.modulus, ordering="sorted",
+                        oov_bucket=thresholded, min_count=args.min_count, top_k=args.top_k, files=file_list)
+    print(f"Saved vocab artifact to {args.save_vocab}")
+
+    # Step 2: Apply mapping in parallel, one compacted output per file / row-group range
     tasks = [
-        delayed(process_column_with_mapping)(file, col, vocab_mapping[col], args.output_dir)
-        for file in file_list
-        for col in columns_pipeline_2
+        delayed(process_file_with_mapping)(file, columns_pipeline_2, args.save_vocab, args.output_dir,
+                                           args.row_group_size, row_group_range, dense_columns)
+        for file, row_group_range in plan_output_tasks(file_list, args.row_groups_per_output)
     ]
     Parallel(n_jobs=args.n_jobs)(tasks)
 
@@ -0,0 +1,145 @@
+import os
+import time
+import argparse
+import numpy as np
+import pyarrow as pa
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+
+from data_utils_vocab_artifact import MAX_LUT_SIZE, save_vocab_artifact
+from data_utils_parquet_common import SPARSE_COLUMNS, list_parquet_files, sparse_column_to_int, iter_row_groups, BufferedParquetWriter
+
+
+class FirstOccurrenceVocab:
+    """Vocabulary that assigns IDs in first-occurrence order while rows stream through.
+
+    Given the same sequence of batches the IDs are always the same, so a fixed
+    file / row-group order makes the fused pass deterministic.
+    """
+
+    def __init__(self, modulus=None):
+        self.modulus = modulus
+        self.size = 0
+        if modulus is not None and modulus <= MAX_LUT_SIZE:
+            self.lut = np.full(modulus, -1, dtype=np.int64)
+        else:
+            self.lut = None
+            # Sorted (keys, ids) runs, each less than half the size of the one before
+            self.runs = []
+        self.keys_in_order = []
+
+    def _lookup(self, uniques):
+        if self.lut is not None:
+            return self.lut[uniques]
+        ids = np.full(len(uniques), -1, dtype=np.int64)
+        for keys, run_ids in self.runs:
+            pos = np.minimum(np.searchsorted(keys, uniques), len(keys) - 1)
+            ids = np.where(keys[pos] == uniques, run_ids[pos], ids)
+        return ids
+
+    def _insert(self, keys, ids):
+        if self.lut is not None:
+            self.lut[keys] = ids
+            return
+        # Merging every batch into one sorted array would copy the whole vocabulary
+        # per row group. Runs are merged only while the newest is at least half the
+        # size of the one before, so there are O(log size) runs and every key is
+        # copied O(log size) times. keys are sorted (they come from np.unique).
+        self.runs.append((keys, ids))
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= 2 * len(self.runs[-1][0]):
+            (keys, ids), (prev_keys, prev_ids) = self.runs.pop(), self.runs.pop()
+            pos = np.searchsorted(prev_keys, keys)
+            self.runs.append((np.insert(prev_keys, pos, keys), np.insert(prev_ids, pos, ids)))
+
+    def fit_transform(self, values):
+        """Assign IDs to unseen values (in order of first appearance) and map the batch."""
+        uniques, first_pos, inverse = np.unique(values, return_index=True, return_inverse=True)
+        ids = self._lookup(uniques)
+        new = ids < 0
+        if new.any():
+            new_keys = uniques[new]
+            # Rank unseen values by where they first appear in this batch
+            order = np.argsort(first_pos[new], kind="stable")
+            new_ids = np.empty(len(new_keys), dtype=np.int64)
+            new_ids[order] = np.arange(self.size, self.size + len(new_keys), dtype=np.int64)
+            ids[new] = new_ids
+            self._insert(new_keys, new_ids)
+            self.keys_in_order.append(new_keys[order])
+            self.size += len(new_keys)
+        return ids[inverse.reshape(-1)]
+
+    def keys(self):
+        """Vocabulary keys indexed by ID."""
+        if not self.keys_in_order:
+            return np.zeros(0, dtype=np.int64)
+        self.keys_in_order = [np.concatenate(self.keys_in_order)]
+        return self.keys_in_order[0]
+
+
+# ----------------------------------------
+# Fused gen+apply pass
+# ----------------------------------------
+def categorify_row_group(table, vocabs, columns, modulus, executor):
+    def transform(col):
+        column = table.column(col)
+        if not column.null_count:
+            return vocabs[col].fit_transform(sparse_column_to_int(column, modulus))
+        # Missing values never enter the vocab and map to -1, as in the two-pass builder
+        ids = np.full(len(column), -1, dtype=np.int64)
+        ids[np.asarray(column.is_valid())] = vocabs[col].fit_transform(sparse_column_to_int(column.drop_null(), modulus))
+        return ids
+
+    # Columns have independent vocabularies, so they can be updated concurrently
+    transformed = dict(zip(columns, executor.map(transform, columns)))
+    for col in columns:
+        idx = table.schema.get_field_index(col)
+        table = table.set_column(idx, col, pa.array(transformed[col]))
+    return table
+
+
+def fused_categorify(file_list, output_dir, columns, modulus, n_threads=8, row_group_size=1000000):
+    os.makedirs(output_dir, exist_ok=True)
+    vocabs = {col: FirstOccurrenceVocab(modulus) for col in columns}
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        for file in tqdm(file_list, desc="Fused categorify"):
+            out_path = os.path.join(output_dir, os.path.basename(file))
+            with BufferedParquetWriter(out_path, row_group_size=row_group_size) as writer:
+                for _, table in iter_row_groups(file):
+                    writer.write_table(categorify_row_group(table, vocabs, columns, modulus, executor))
+    return vocabs
+
+
+def save_first_occurrence_vocabs(vocabs, vocab_dir, modulus=None, files=None):
+    # files: the inputs the vocabulary covers, so the incremental builder only adds newer ones
+    save_vocab_artifact(vocab_dir, {col: vocab.keys() for col, vocab in vocabs.items()},
+                        modulus=modulus, ordering="first_occurrence", files=files)
+
+
+# ----------------------------------------
+# Argument parsing and orchestration
+# ----------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Single-pass fused vocab gen+apply (first-occurrence IDs) over Parquet files")
+    parser.add_argument("--data-dir", type=str, required=True, help="Folder containing Parquet files")
+    parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
+    parser.add_argument("--modulus", type=int, default=8192, help="Hash modulus for categorical values")
+    parser.add_argument("--n-threads", type=int, default=8, help="Threads used to categorify columns of a row group")
+    parser.add_argument("--output-dir", type=str, required=True, help="Folder to write transformed Parquet files")
+    parser.add_argument("--row-group-size", type=int, default=1000000, help="Rows per row group in the output files")
+    parser.add_argument("--vocab-dir", type=str, default="vocab_first_occurrence", help="Folder to save the vocab artifact")
+    args = parser.parse_args()
+
+    file_list = list_parquet_files(args.data_dir, args.file_pattern)
+    print(f"Found {len(file_list)} files")
+
+    start_time = time.time()
+    vocabs = fused_categorify(file_list, args.output_dir, SPARSE_COLUMNS, args.modulus, args.n_threads, args.row_group_size)
+    save_first_occurrence_vocabs(vocabs, args.vocab_dir, args.modulus, files=file_list)
+
+    total_time = time.time() - start_time
+    print(f"Vocab sizes: {', '.join(f'{col}={v.size}' for col, v in vocabs.items())}")
+    print(f"\nTotal execution time: {total_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import re
+import time
+import shutil
+import argparse
+import numpy as np
+from joblib import Parallel, delayed
+
+from data_utils_parquet_common import list_parquet_files
+from data_utils_vocab_artifact import save_vocab_artifact, load_vocab_artifact, load_manifest
+from data_utils_parquet_vocab_1TB_no import collect_unique_values, process_file_with_mapping
+
+# ----------------------------------------
+# Incremental vocabulary extension
+# ----------------------------------------
+def find_new_files(manifest, file_list):
+    covered = set(manifest.get("files", []))
+    return [f for f in file_list if os.path.basename(f) not in covered]
+
+
+def prune_generations(vocab_dir, keep):
+    """Delete vocab arrays and generation folders not referenced by the manifests in keep.
+
+    The previous manifest is kept too, for readers that still have it open.
+    """
+    referenced = {path.split(os.sep)[0] for manifest in keep for entry in manifest["columns"].values()
+                  for path in (entry["file"], entry.get("ids_file", ""))}
+    for name in os.listdir(vocab_dir):
+        path = os.path.join(vocab_dir, name)
+        if name in referenced:
+            continue
+        if name.endswith(".npy") and os.path.isfile(path):
+            os.remove(path)
+        elif re.fullmatch(r"v\d{4}", name) and os.path.isdir(path):
+            shutil.rmtree(path)
+
+
+def extend_vocab_artifact(vocab_dir, new_files, n_jobs=8, memory_budget_bytes=1 << 30, spill_dir=None):
+    """Append values first seen in new_files to an existing vocab artifact.
+
+    Existing IDs never change: unseen values get IDs size, size+1, ... in sorted
+    key order, so the extension is deterministic. Returns the per-column number
+    of appended values.
+    """
+    manifest = load_manifest(vocab_dir)
+    entries = manifest["columns"]
+    if any("oov_id" in entry for entry in entries.values()):
+        # The OOV bucket sits at ID == size, so appending would move it; thresholded
+        # vocabularies also need the full counts, which the artifact does not keep.
+        raise ValueError(f"{vocab_dir} is a thresholded vocabulary (min_count/top_k); rebuild it instead")
+
+    columns = list(entries)
+    modulus = entries[columns[0]]["modulus"] if columns else None
+    vocabs = load_vocab_artifact(vocab_dir)
+    new_uniques = collect_unique_values(new_files, columns, modulus, n_jobs, memory_budget_bytes, spill_dir)
+
+    extended, appended = {}, {}
+    for col in columns:
+        candidates = np.asarray(new_uniques[col])
+        unseen = candidates[vocabs[col].lookup(candidates) < 0]
+        extended[col] = np.concatenate([vocabs[col].keys_by_id(), unseen])
+        appended[col] = len(unseen)
+
+    # The new generation goes to its own subdirectory and the manifest switch is
+    # a single atomic rename, so readers see the old or the new vocabulary.
+    generation = manifest.get("generation", 0) + 1
+    save_vocab_artifact(vocab_dir, extended, modulus=modulus, ordering="incremental",
+                        files=manifest.get("files", []) + [os.path.basename(f) for f in new_files],
+                        generation=generation)
+    prune_generations(vocab_dir, keep=[manifest, load_manifest(vocab_dir)])
+    return appended
+
+
+# ----------------------------------------
+# Argument parsing and orchestration
+# ----------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Extend an existing vocab artifact with newly arrived Parquet files")
+    parser.add_argument("--data-dir", type=str, required=True, help="Folder containing Parquet files (old and new)")
+    parser.add_argument("--file-pattern", type=str, default="*.parquet", help="Glob pattern (default: *.parquet)")
+    parser.add_argument("--vocab-dir", type=str, required=True, help="Existing vocab artifact to extend in place")
+    parser.add_argument("--n-jobs", type=int, default=8, help="Number of parallel jobs")
+    parser.add_argument("--memory-budget-mb", type=int, default=1024, help="Spill a column's uniques to disk above this size")
+    parser.add_argument("--spill-dir", type=str, default=None, help="Folder for spilled unique partitions (default: no spilling)")
+    parser.add_argument("--output-dir", type=str, default=None, help="If set, also categorify the new files into this folder")
+    parser.add_argument("--row-group-size", type=int, default=1000000, help="Rows per row group in the output files")
+    args = parser.parse_args()
+
+    file_list = list_parquet_files(args.data_dir, args.file_pattern)
+    new_files = find_new_files(load_manifest(args.vocab_dir), file_list)
+    print(f"Found {len(file_list)} files, {len(new_files)} not covered by {args.vocab_dir}")
+    if not new_files:
+        return
+
+    start_time = time.time()
+    appended = extend_vocab_artifact(args.vocab_dir, new_files, args.n_jobs,
+                                     args.memory_budget_mb * 1024**2, args.spill_dir)
+    print(f"Appended values: {', '.join(f'{col}=+{n}' for col, n in appended.items())}")
+
+    if args.output_dir is not None:
+        columns = list(appended)
+        Parallel(n_jobs=args.n_jobs)(
+            delayed(process_file_with_mapping)(file, columns, args.vocab_dir, args.output_dir, args.row_group_size)
+            for file in new_files
+        )
+
+    total_time = time.time() - start_time
+    print(f"\nTotal execution time: {total_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+import os
+import glob
+import time
+import struct
+import argparse
+from multiprocessing import Pool
+
+from data_utils_column_stats import STATS_KEY
+
+# crc32c is optional: only needed for --verify_crc on tfrecord inputs
+try:
+    from google_crc32c import value as crc32c
+except ImportError:
+    try:
+        from crc32c import crc32c
+    except ImportError:
+        crc32c = None
+
+# ----------------------------------------
+# Local, decode-free shard rebalancer (same CLI as apache_beam_shard.py)
+#
+# The inputs are treated as one byte stream and cut into num_output_files
+# pieces of about equal size. Cuts are moved forward to the next record
+# boundary, so every output is a list of byte ranges copied from the inputs
+# (copy_file_range where available); no payload is decoded.
+#
+# tfrecord  boundaries found by walking the 16-byte record framing (length,
+#           length crc, data, data crc); --verify_crc also checks both crcs
+# csv       boundaries are the byte after the next newline
+# parquet   whole row groups are relocated: their column chunks are copied as
+#           they are and the footer is rewritten with shifted offsets (page
+#           indexes and bloom filters, stored outside the row groups, are dropped)
+#
+# Output names follow Beam's sharded sinks: <output_path>-00000-of-00256<suffix>.
+# ----------------------------------------
+FILE_SUFFIX = {"tfrecord": ".tfrecord", "csv": "", "parquet": ".parquet"}
+COPY_BLOCK = 1 << 24
+PARQUET_MAGIC = b"PAR1"
+TFRECORD_HEADER = struct.Struct("<QI")  # length, masked crc32c of the length
+
+
+def output_paths(output_path, num_output_files, filetype):
+    suffix = FILE_SUFFIX[filetype]
+    return [f"{output_path}-{i:05d}-of-{num_output_files:05d}{suffix}" for i in range(num_output_files)]
+
+
+def _copy_range(src, start, end, dst):
+    """Append bytes [start, end) of the file src to the unbuffered binary file dst."""
+    remaining, offset = end - start, start
+    with open(src, "rb") as f:
+        if hasattr(os, "copy_file_range"):
+            try:
+                while remaining > 0:
+                    n = os.copy_file_range(f.fileno(), dst.fileno(), min(remaining, 1 << 30), offset)
+                    if n == 0:
+                        break
+                    offset, remaining = offset + n, remaining - n
+            except OSError:
+                pass  # e.g. across filesystems on older kernels: finish with plain reads
+        f.seek(offset)
+        while remaining > 0:
+            block = f.read(min(remaining, COPY_BLOCK))
+            if not block:
+                raise EOFError(f"{src} ended at byte {offset}, expected {end}")
+            dst.write(block)
+            offset, remaining = offset + len(block), remaining - len(block)
+
+
+# ----------------------------------------
+# tfrecord / csv: byte-stream cuts aligned to record boundaries
+# ----------------------------------------
+def _masked_crc(data):
+    crc = crc32c(data)
+    return ((((crc >> 15) | (crc << 17)) & 0xFFFFFFFF) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+def tfrecord_boundaries(path, cuts, verify_crc=False):
+    """First record boundary at or after each (sorted) offset in cuts, and the record count."""
+    aligned, num_records, i = [], 0, 0
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos < size:
+            while i < len(cuts) and cuts[i] <= pos:
+                aligned.append(pos)
+                i += 1
+            header = f.read(TFRECORD_HEADER.size)
+            if len(header) < TFRECORD_HEADER.size:
+                raise ValueError(f"{path}: truncated record header at byte {pos}")
+            length, length_crc = TFRECORD_HEADER.unpack(header)
+            if verify_crc:
+                data, data_crc = f.read(length), f.read(4)
+                if len(data_crc) < 4:
+                    raise ValueError(f"{path}: truncated record at byte {pos}")
+                if _masked_crc(header[:8]) != length_crc or _masked_crc(data) != struct.unpack("<I", data_crc)[0]:
+                    raise ValueError(f"{path}: crc mismatch in record at byte {pos}")
+            else:
+                f.seek(length + 4, os.SEEK_CUR)
+            pos += TFRECORD_HEADER.size + length + 4
+            num_records += 1
+        if pos > size:
+            raise ValueError(f"{path}: truncated record at byte {pos - TFRECORD_HEADER.size - length - 4}")
+    return aligned + [size] * (len(cuts) - i), num_records
+
+
+def csv_boundaries(path, cuts, verify_crc=False):
+    """Start of the first line at or after each offset in cuts (line count is not computed)."""
+    aligned = []
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        for cut in cuts:
+            if cut <= 0:
+                aligned.append(0)
+                continue
+            # A cut just after a newline is already a line start
+            f.seek(cut - 1)
+            pos = cut - 1
+            while True:
+                block = f.read(1 << 16)
+                if not block:
+                    aligned.append(size)
+                    break
+                newline = block.find(b"\n")
+                if newline >= 0:
+                    aligned.append(pos + newline + 1)
+                    break
+                pos += len(block)
+    return aligned, None
+
+
+def plan_byte_segments(input_files, num_output_files, filetype, n_jobs=8, verify_crc=False):
+    """Per output, the list of (path, start, end, newline) ranges to copy.
+
+    newline is set on ranges that end at the end of a csv file without a
+    trailing newline, so lines of consecutive inputs are not joined.
+    """
+    sizes = [os.path.getsize(f) for f in input_files]
+    total = sum(sizes)
+    global_cuts = [total * k // num_output_files for k in range(1, num_output_files)]
+    file_start = [sum(sizes[:i]) for i in range(len(sizes))]
+    local_cuts = [[c - file_start[i] for c in global_cuts if file_start[i] <= c < file_start[i] + sizes[i]]
+                  for i in range(len(input_files))]
+    # tfrecord must walk every input for its framing (and crcs); csv only touches the cuts
+    scan = tfrecord_boundaries if filetype == "tfrecord" else csv_boundaries
+    with Pool(n_jobs) as pool:
+        scanned = pool.starmap(scan, [(f, cuts, verify_crc) for f, cuts in zip(input_files, local_cuts)])
+    num_records = None if filetype == "csv" else sum(n for _, n in scanned)
+
+    # Output boundaries as (file index, offset) positions in the concatenated inputs
+    boundaries = [(0, 0)]
+    for i, (aligned, _) in enumerate(scanned):
+        boundaries += [(i, offset) for offset in aligned]
+    boundaries.append((len(input_files), 0))
+
+    unterminated = set()
+    if filetype == "csv":
+        for i, f in enumerate(input_files):
+            if sizes[i]:
+                with open(f, "rb") as fh:
+                    fh.seek(sizes[i] - 1)
+                    if fh.read(1) != b"\n":
+                        unterminated.add(i)
+
+    segments = []
+    for (file_a, off_a), (file_b, off_b) in zip(boundaries[:-1], boundaries[1:]):
+        output = []
+        for i in range(file_a, min(file_b, len(input_files) - 1) + 1):
+            start = off_a if i == file_a else 0
+            end = off_b if i == file_b else sizes[i]
+            if end > start:
+                output.append((input_files[i], start, end, end == sizes[i] and i in unterminated))
+        segments.append(output)
+    return segments, num_records
+
+
+def write_byte_segments(path, segments):
+    with open(path, "wb", buffering=0) as dst:
+        for src, start, end, newline in segments:
+            _copy_range(src, start, end, dst)
+            if newline:
+                dst.write(b"\n")
+    return path, os.path.getsize(path)
+
+
+# ----------------------------------------
+# parquet: thrift compact protocol, enough to rewrite the footer
+#
+# Structs are kept as [[field_id, type, value], ...] and lists as
+# (element_type, [values]), so unknown fields round-trip unchanged.
+# ----------------------------------------
+(T_STOP, T_TRUE, T_FALSE, T_BYTE, T_I16, T_I32, T_I64, T_DOUBLE,
+ T_BINARY, T_LIST, T_SET, T_MAP, T_STRUCT) = range(13)
+
+
+class _ThriftReader:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+
+    def byte(self):
+        b = self.buffer[self.pos]
+        self.pos += 1
+        return b
+
+    def varint(self):
+        result = shift = 0
+        while True:
+            b = self.byte()
+            result |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                return result
+
+    def zigzag(self):
+        n = self.varint()
+        return (n >> 1) ^ -(n & 1)
+
+    def value(self, ttype):
+        if ttype in (T_TRUE, T_FALSE):
+            # Bool list elements are a whole byte; struct field bools live in the type
+            return self.byte() == 1
+        if ttype == T_BYTE:
+            b = self.byte()
+            return b - 256 if b > 127 else b
+        if ttype in (T_I16, T_I32, T_I64):
+            return self.zigzag()
+        if ttype == T_DOUBLE:
+            (value,) = struct.unpack_from("<d", self.buffer, self.pos)
+            self.pos += 8
+            return value
+        if ttype == T_BINARY:
+            n = self.varint()
+            value = bytes(self.buffer[self.pos:self.pos + n])
+            self.pos += n
+            return value
+        if ttype in (T_LIST, T_SET):
+            header = self.byte()
+            size, etype = header >> 4, header & 0x0F
+            if size == 15:
+                size = self.varint()
+            return etype, [self.value(etype) for _ in range(size)]
+        if ttype == T_MAP:
+            size = self.varint()
+            if size == 0:
+                return T_STOP, T_STOP, []
+            types = self.byte()
+            ktype, vtype = types >> 4, types & 0x0F
+            return ktype, vtype, [(self.value(ktype), self.value(vtype)) for _ in range(size)]
+        if ttype == T_STRUCT:
+            return self.struct()
+        raise ValueError(f"Unknown thrift compact type {ttype}")
+
+    def struct(self):
+        fields, last = [], 0
+        while True:
+            header = self.byte()
+            if header == T_STOP:
+                return fields
+            delta, ttype = header >> 4, header & 0x0F
+            fid = last + delta if delta else self.zigzag()
+            value = ttype == T_TRUE if ttype in (T_TRUE, T_FALSE) else self.value(ttype)
+            fields.append([fid, ttype, value])
+            last = fid
+
+
+def _write_varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _write_zigzag(out, n):
+    _write_varint(out, (n << 1) ^ (n >> 63))
+
+
+def _write_value(out, ttype, value):
+    if ttype in (T_TRUE, T_FALSE):
+        out.append(1 if value else 2)
+    elif ttype == T_BYTE:
+        out.append(value & 0xFF)
+    elif ttype in (T_I16, T_I32, T_I64):
+        _write_zigzag(out, value)
+    elif ttype == T_DOUBLE:
+        out += struct.pack("<d", value)
+    elif ttype == T_BINARY:
+        _write_varint(out, len(value))
+        out += value
+    elif ttype in (T_LIST, T_SET):
+        etype, values = value
+        if len(values) < 15:
+            out.append((len(values) << 4) | etype)
+        else:
+            out.append(0xF0 | etype)
+            _write_varint(out, len(values))
+        for v in values:
+            _write_value(out, etype, v)
+    elif ttype == T_MAP:
+        ktype, vtype, pairs = value
+        _write_varint(out, len(pairs))
+        if pairs:
+            out.append((ktype << 4) | vtype)
+            for k, v in pairs:
+                _write_value(out, ktype, k)
+                _write_value(out, vtype, v)
+    elif ttype == T_STRUCT:
+        _write_struct(out, value)
+    else:
+        raise ValueError(f"Unknown thrift compact type {ttype}")
+
+
+def _write_struct(out, fields):
+    last = 0
+    for fid, ttype, value in fields:
+        wire = (T_TRUE if value else T_FALSE) if ttype in (T_TRUE, T_FALSE) else ttype
+        if 0 < fid - last <= 15:
+            out.append(((fid - last) << 4) | wire)
+        else:
+            out.append(wire)
+            _write_zigzag(out, fid)
+        if wire not in (T_TRUE, T_FALSE):
+            _write_value(out, ttype, value)
+        last = fid
+    out.append(T_STOP)
+
+
+def _get(fields, fid, default=None):
+    for f in fields:
+        if f[0] == fid:
+            return f[2]
+    return default
+
+
+def _set(fields, fid, ttype, value):
+    for f in fields:
+        if f[0] == fid:
+            f[1], f[2] = ttype, value
+            return
+    fields.append([fid, ttype, value])
+    fields.sort(key=lambda f: f[0])
+
+
+def _drop(fields, fids):
+    fields[:] = [f for f in fields if f[0] not in fids]
+
+
+# FileMetaData: 2 schema, 3 num_rows, 4 row_groups, 5 key_value_metadata
+# RowGroup: 1 columns, 3 num_rows, 5 file_offset, 7 ordinal
+# ColumnChunk: 1 file_path, 2 file_offset, 3 meta_data, 4-7 offset/column index
+# ColumnMetaData: 7 total_compressed_size, 9 data page, 10 index page,
+#                 11 dictionary page offsets, 14-15 bloom filter
+def read_parquet_footer(path):
+    """Parsed FileMetaData of a parquet file, read without pyarrow."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(size - 8)
+        footer_length, magic = struct.unpack("<I4s", f.read(8))
+        if magic != PARQUET_MAGIC:
+            raise ValueError(f"{path}: not a plain parquet file (magic {magic!r}; encrypted footers are not supported)")
+        f.seek(size - 8 - footer_length)
+        return _ThriftReader(f.read(footer_length)).struct()
+
+
+def row_group_extent(row_group):
+    """Byte range [start, end) covered by the column chunks of a row group."""
+    start, end = None, 0
+    for chunk in _get(row_group, 1)[1]:
+        if _get(chunk, 1) is not None:
+            raise ValueError("Column chunks stored in external files are not supported")
+        meta = _get(chunk, 3)
+        offsets = [o for o in (_get(meta, 9), _get(meta, 10), _get(meta, 11)) if o]
+        chunk_start = min(offsets)
+        start = chunk_start if start is None else min(start, chunk_start)
+        end = max(end, chunk_start + _get(meta, 7))
+    return start, end
+
+
+def relocate_row_group(row_group, shift, ordinal):
+    """Shift the offsets of a row group copied shift bytes further into a new file."""
+    for chunk in _get(row_group, 1)[1]:
+        if _get(chunk, 2):
+            _set(chunk, 2, T_I64, _get(chunk, 2) + shift)
+        _drop(chunk, {4, 5, 6, 7})
+        meta = _get(chunk, 3)
+        for fid in (9, 10, 11):
+            if _get(meta, fid):
+                _set(meta, fid, T_I64, _get(meta, fid) + shift)
+        _drop(meta, {14, 15})
+    if _get(row_group, 5) is not None:
+        _set(row_group, 5, T_I64, _get(row_group, 5) + shift)
+    _set(row_group, 7, T_I16, ordinal)
+    return row_group
+
+
+def plan_row_groups(input_files, num_output_files):
+    """Per output, the list of (path, start, end, row_group) to relocate, balanced by bytes.
+
+    Row groups stay in input order; each goes to the output that holds the
+    middle of its byte range in the concatenated inputs.
+    """
+    footers = [read_parquet_footer(f) for f in input_files]
+    schema = _encode(footers[0], 2)
+    row_groups = []
+    for path, footer in zip(input_files, footers):
+        if _encode(footer, 2) != schema:
+            raise ValueError(f"{path}: schema differs from {input_files[0]}")
+        for row_group in _get(footer, 4, (T_STRUCT, []))[1]:
+            start, end = row_group_extent(row_group)
+            row_groups.append((path, start, end, row_group))
+    total = sum(end - start for _, start, end, _ in row_groups)
+    segments = [[] for _ in range(num_output_files)]
+    before = 0
+    for rg in row_groups:
+        size = rg[2] - rg[1]
+        output = min(int((before + size / 2) * num_output_files / max(total, 1)), num_output_files - 1)
+        segments[output].append(rg)
+        before += size
+    num_rows = sum(_get(rg[3], 3) for rg in row_groups)
+    return footers[0], segments, num_rows
+
+
+def _encode(fields, fid):
+    out = bytearray()
+    for f in fields:
+        if f[0] == fid:
+            _write_value(out, f[1], f[2])
+    return bytes(out)
+
+
+def write_row_groups(path, template, segments):
+    """Write a parquet file from whole row groups of other files and a footer built from template."""
+    row_groups = []
+    with open(path, "wb", buffering=0) as dst:
+        dst.write(PARQUET_MAGIC)
+        for src, start, end, row_group in segments:
+            shift = dst.tell() - start
+            _copy_range(src, start, end, dst)
+            row_groups.append(relocate_row_group(row_group, shift, len(row_groups)))
+        footer = [list(f) for f in template]
+        _set(footer, 3, T_I64, sum(_get(rg, 3) for rg in row_groups))
+        _set(footer, 4, T_LIST, (T_STRUCT, row_groups))
+        # Our per-file stats describe the input file, not this one
+        key_values = _get(footer, 5)
+        if key_values is not None:
+            _set(footer, 5, T_LIST, (T_STRUCT, [kv for kv in key_values[1] if _get(kv, 1) != STATS_KEY]))
+        out = bytearray()
+        _write_struct(out, footer)
+        dst.write(bytes(out) + struct.pack("<I", len(out)) + PARQUET_MAGIC)
+    return path, os.path.getsize(path)
+
+
+# ----------------------------------------
+# Driver
+# ----------------------------------------
+def list_input_files(input_path):
+    """Sorted files matching input_path (a glob pattern, a file or a directory)."""
+    if os.path.isdir(input_path):
+        input_path = os.path.join(input_path, "*")
+    return sorted(f for f in glob.glob(input_path) if os.path.isfile(f))
+
+
+def rebalance(input_path, output_path, num_output_files=256, filetype="tfrecord", n_jobs=8, verify_crc=False):
+    if filetype not in FILE_SUFFIX:
+        raise ValueError(f"filetype must be one of {sorted(FILE_SUFFIX)}, got {filetype!r}")
+    if verify_crc and filetype == "tfrecord" and crc32c is None:
+        raise ImportError("--verify_crc requires google-crc32c or crc32c")
+    input_files = list_input_files(input_path)
+    if not input_files:
+        raise FileNotFoundError(f"No input files match {input_path}")
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    paths = output_paths(output_path, num_output_files, filetype)
+
+    if filetype == "parquet":
+        template, segments, num_records = plan_row_groups(input_files, num_output_files)
+        tasks, write = [(p, template, s) for p, s in zip(paths, segments)], write_row_groups
+    else:
+        segments, num_records = plan_byte_segments(input_files, num_output_files, filetype, n_jobs, verify_crc)
+        tasks, write = list(zip(paths, segments)), write_byte_segments
+    with Pool(n_jobs) as pool:
+        results = pool.starmap(write, tasks)
+    return results, num_records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebalance CSV/TFRecord/parquet shards locally without decoding records")
+    parser.add_argument("--input_path", required=True, help="Input path (glob pattern, file or directory).")
+    parser.add_argument("--output_path", required=True, help="Output path prefix.")
+    parser.add_argument("--num_output_files", type=int, default=256, help="Number of output file shards.")
+    parser.add_argument("--filetype", default="tfrecord", help="File type, needs to be one of {tfrecord, csv, parquet}.")
+    parser.add_argument("--n_jobs", type=int, default=8, help="Worker processes for scanning and copying.")
+    parser.add_argument("--verify_crc", action="store_true", help="Check tfrecord length and data crcs while scanning.")
+    # Accepted for command line compatibility with apache_beam_shard.py; unused locally
+    parser.add_argument("--project", default=None, help="Ignored (Beam only).")
+    parser.add_argument("--runner", default=None, help="Ignored (Beam only).")
+    parser.add_argument("--region", default=None, help="Ignored (Beam only).")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    results, num_records = rebalance(args.input_path, args.output_path, args.num_output_files, args.filetype,
+                                     args.n_jobs, args.verify_crc)
+    total_bytes = sum(size for _, size in results)
+    elapsed = time.time() - start_time
+    records = f", {num_records:,} records" if num_records is not None else ""
+    print(f"Wrote {len(results)} files ({total_bytes / 1024**2:.1f} MB{records}) in {elapsed:.2f} seconds "
+          f"({total_bytes / 1024**2 / max(elapsed, 1e-9):.1f} MB/s)")
+
+if __name__ == "__main__":
+    main()
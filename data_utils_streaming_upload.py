@@ -0,0 +1,230 @@
+import io
+import os
+import time
+import argparse
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ----------------------------------------
+# Streaming upload to object storage
+#
+# StreamingUploadFile is a write-only file object for pq.ParquetWriter (or any
+# writer): bytes are cut into parts of part_size and uploaded while the caller
+# keeps producing, with at most max_pending parts in flight (memory bound:
+# (max_pending + 1) * part_size). Nothing touches the local disk.
+#
+# "parts"   each part is uploaded concurrently as its own object
+#           (<path>.parts/part-NNNNN) and close() merges them into <path> with
+#           the filesystem's server-side merge (gcsfs compose, s3fs multipart
+#           copy), MAX_MERGE_PARTS at a time; without a server-side merge
+#           (local, memory: offline benchmarks of this mode) the parts are
+#           concatenated by the client
+# "stream"  parts are written in order into one fs.open(path, "wb") stream on a
+#           background thread; for filesystems without merge (local, memory).
+#           The stream is opened with autocommit=False where the filesystem
+#           supports it (local temp file, pending s3/gcs upload), so nothing
+#           appears at path before close() commits and abort() discards it.
+#           Filesystems without deferred commit (memory) expose the partial
+#           object at path until abort() removes it.
+# ----------------------------------------
+DEFAULT_PART_SIZE = 16 * 1024 * 1024  # >= the 5 MiB multipart minimum of S3
+MAX_MERGE_PARTS = 32                  # GCS compose limit per request
+
+
+def upload_mode(fs):
+    return "parts" if hasattr(fs, "merge") else "stream"
+
+
+class StreamingUploadFile(io.RawIOBase):
+    def __init__(self, fs, path, part_size=DEFAULT_PART_SIZE, max_pending=4, mode=None):
+        self.fs = fs
+        self.path = path
+        self.part_size = part_size
+        self.mode = mode or upload_mode(fs)
+        self.buffer = bytearray()
+        self.position = 0
+        self.part_paths = []
+        self.futures = []
+        self.peak_buffered = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=max_pending if self.mode == "parts" else 1)
+        # No-op on object stores; local targets need their directories
+        fs.makedirs(f"{path}.parts" if self.mode == "parts" else posixpath.dirname(path), exist_ok=True)
+        self._stream = self._open_stream() if self.mode == "stream" else None
+
+    def _open_stream(self):
+        try:
+            stream = self.fs.open(self.path, "wb", autocommit=False)
+        except (TypeError, NotImplementedError):
+            stream = self.fs.open(self.path, "wb")
+        # Filesystems that ignore autocommit publish as they write
+        self._deferred_commit = getattr(stream, "autocommit", True) is False
+        return stream
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        self.buffer += data
+        self.position += len(data)
+        self.peak_buffered = max(self.peak_buffered, len(self.buffer))
+        while len(self.buffer) >= self.part_size:
+            self._submit(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def _submit(self, part):
+        # Blocks the producer once max_pending parts are in flight
+        self._slots.acquire()
+        if self.mode == "parts":
+            part_path = f"{self.path}.parts/part-{len(self.part_paths):05d}"
+            self.part_paths.append(part_path)
+            self.futures.append(self._executor.submit(self._upload_part, part_path, part))
+        else:
+            self.futures.append(self._executor.submit(self._stream_part, part))
+
+    def _upload_part(self, part_path, part):
+        try:
+            self.fs.pipe_file(part_path, part)
+        finally:
+            self._slots.release()
+
+    def _stream_part(self, part):
+        try:
+            self._stream.write(part)
+        finally:
+            self._slots.release()
+
+    def _merge(self):
+        if not hasattr(self.fs, "merge"):
+            with self.fs.open(self.path, "wb") as out:
+                for part_path in self.part_paths:
+                    out.write(self.fs.cat_file(part_path))
+            self.fs.rm(f"{self.path}.parts", recursive=True)
+            return
+        sources = self.part_paths
+        level = 0
+        # Merge in groups the backend accepts until one object is left
+        while len(sources) > MAX_MERGE_PARTS:
+            merged = []
+            for g in range(0, len(sources), MAX_MERGE_PARTS):
+                target = f"{self.path}.parts/merge-{level}-{g // MAX_MERGE_PARTS:05d}"
+                self.fs.merge(target, sources[g:g + MAX_MERGE_PARTS])
+                merged.append(target)
+            sources, level = merged, level + 1
+        self.fs.merge(self.path, sources)
+        self.fs.rm(f"{self.path}.parts", recursive=True)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.buffer or (self.mode == "parts" and not self.part_paths):
+                self._submit(bytes(self.buffer))
+                self.buffer = bytearray()
+            for future in self.futures:
+                future.result()
+            if self.mode == "parts":
+                self._merge()
+            else:
+                self._stream.close()
+                if self._deferred_commit:
+                    self._stream.commit()
+        except BaseException:
+            # A failed last upload or merge must not leave parts behind either
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown()
+            super().close()
+
+    def abort(self):
+        """Drop everything written so far; nothing is left at path."""
+        if self.closed:
+            return
+        # fs is an fsspec filesystem, so fsspec is importable here
+        from fsspec.spec import AbstractBufferedFile
+        try:
+            for future in self.futures:
+                future.exception()
+            if self.mode == "stream" and self._deferred_commit:
+                # Never committed: drop the temp file / pending upload, path is not touched
+                self._stream.discard()
+                if isinstance(self._stream, AbstractBufferedFile):
+                    # close() would flush the buffered tail into a new upload
+                    self._stream.closed = True
+                else:
+                    self._stream.close()
+                targets = []
+            elif self.mode == "stream":
+                self._stream.close()
+                targets = [self.path]
+            else:
+                targets = [f"{self.path}.parts"]
+            for target in targets:
+                if self.fs.exists(target):
+                    self.fs.rm(target, recursive=True)
+        finally:
+            self._executor.shutdown()
+            super().close()
+
+
+def open_output(path, part_size=DEFAULT_PART_SIZE, max_pending=4, mode=None, **storage_options):
+    """Writable target for a local path or fsspec URL (gs://, s3://, memory://, file://...).
+
+    Plain local paths are returned unchanged so writers keep their native file I/O.
+    """
+    if "://" not in path:
+        return path
+    # Imported here: only remote/fsspec targets need it (gcsfs / s3fs for gs:// / s3://)
+    import fsspec
+    fs, fs_path = fsspec.core.url_to_fs(path, **storage_options)
+    return StreamingUploadFile(fs, fs_path, part_size, max_pending, mode)
+
+
+def close_output(target, abort=False):
+    """Finish (or, after a failed write, abort) a target returned by open_output."""
+    if isinstance(target, str):
+        return
+    if abort:
+        target.abort()
+    else:
+        target.close()
+
+
+def main():
+    from data_utils_synthetic_criteo import DEFAULT_ROW_GROUP_SIZE, PROFILES, write_synthetic_parquet
+
+    parser = argparse.ArgumentParser(description="Benchmark streaming a synthetic parquet shard to an fsspec target")
+    parser.add_argument("--output", type=str, default="memory://bench/criteo_part_0000.parquet",
+                        help="fsspec URL (memory://, file://, gs://, s3://)")
+    parser.add_argument("--num-rows", type=int, default=1000000, help="Rows to generate")
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE, help="Rows per row group")
+    parser.add_argument("--profile", type=str, default="uniform", choices=list(PROFILES), help="Value distributions")
+    parser.add_argument("--part-mb", type=int, default=DEFAULT_PART_SIZE // 1024**2, help="Upload part size in MiB")
+    parser.add_argument("--max-pending", type=int, default=4, help="Parts in flight (bounds memory)")
+    parser.add_argument("--mode", type=str, default=None, choices=["parts", "stream"], help="Force an upload mode")
+    args = parser.parse_args()
+
+    if "://" not in args.output:
+        args.output = "file://" + os.path.abspath(args.output)
+    start_time = time.time()
+    target = open_output(args.output, args.part_mb * 1024**2, args.max_pending, args.mode)
+    try:
+        write_synthetic_parquet(target, args.num_rows, row_group_size=args.row_group_size, seed=0, profile=args.profile)
+    except BaseException:
+        close_output(target, abort=True)
+        raise
+    close_output(target)
+    total_time = time.time() - start_time
+    size_mb = target.tell() / 1024**2
+    print(f"Uploaded {size_mb:.1f} MB to {args.output} ({target.mode} mode) in {total_time:.2f} seconds "
+          f"({size_mb / max(total_time, 1e-9):.1f} MB/s, peak buffer {target.peak_buffered / 1024**2:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
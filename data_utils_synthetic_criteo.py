@@ -0,0 +1,301 @@
+import os
+import time
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from tqdm import tqdm
+
+from data_utils_parquet_common import int_to_hex
+from data_utils_parquet_cardinality_sketch import hash64
+from data_utils_streaming_upload import open_output, close_output
+
+# ----------------------------------------
+# Vectorized, streaming synthetic Criteo generator
+#
+# label: int64 0/1, dense: float32, sparse: 8-char upper-case hex strings (same
+# schema as the original per-row generators). One row group is generated at a
+# time and handed to pq.ParquetWriter, so memory stays at a single row group
+# per process.
+# ----------------------------------------
+DEFAULT_ROW_GROUP_SIZE = 1_000_000
+
+# ----------------------------------------
+# Distribution profiles
+#
+# "uniform"   the original generators: CTR 0.5, dense uniform in [-1000, 1000),
+#             sparse uniform over 2^32 (near-all-unique keys, worst case)
+# "kaggle"    Criteo Kaggle (Display Advertising Challenge) shape
+# "terabyte"  Criteo Terabyte shape
+#
+# Realistic profiles draw each sparse column from a Zipf(s) distribution over
+# `cardinality` ranks (rank 1 most frequent), hashed to a stable 32-bit key;
+# dense columns are heavy-tailed non-negative counts (floor of a log-normal).
+# Per-feature cardinalities are the published counts of the two datasets;
+# missing rates and CTR are approximate values measured on Kaggle day data.
+# ----------------------------------------
+KAGGLE_CARDINALITIES = [
+    1460, 583, 10131227, 2202608, 305, 24, 12517, 633, 3, 93145, 5683, 8351593, 3194,
+    27, 14992, 5461306, 10, 5652, 2173, 4, 7046547, 18, 15, 286181, 105, 142572,
+]
+TERABYTE_CARDINALITIES = [
+    227605432, 39060, 17295, 7424, 20265, 3, 7122, 1543, 63, 130229467, 3067956, 405282, 10,
+    2209, 11938, 155, 4, 976, 14, 292775614, 40790948, 187188510, 590152, 12973, 108, 36,
+]
+CRITEO_DENSE_MISSING = [0.45, 0.0, 0.21, 0.22, 0.03, 0.22, 0.04, 0.0, 0.04, 0.45, 0.04, 0.77, 0.22]
+CRITEO_SPARSE_MISSING = [
+    0.0, 0.0, 0.03, 0.03, 0.0, 0.12, 0.0, 0.0, 0.0, 0.0, 0.0, 0.03, 0.0,
+    0.0, 0.0, 0.03, 0.0, 0.0, 0.44, 0.44, 0.03, 0.76, 0.0, 0.03, 0.44, 0.44,
+]
+# Median of each count feature; the log-normal sigma gives the heavy tail
+CRITEO_DENSE_MEDIAN = [1, 3, 7, 4, 2800, 30, 3, 8, 40, 1, 1, 1, 4]
+
+PROFILES = {
+    "uniform": {"ctr": 0.5},
+    "kaggle": {
+        "ctr": 0.256,
+        "cardinalities": KAGGLE_CARDINALITIES,
+        "zipf_s": 1.1,
+        "dense_median": CRITEO_DENSE_MEDIAN,
+        "dense_sigma": 1.5,
+        "dense_missing": CRITEO_DENSE_MISSING,
+        "sparse_missing": CRITEO_SPARSE_MISSING,
+    },
+    "terabyte": {
+        "ctr": 0.034,
+        "cardinalities": TERABYTE_CARDINALITIES,
+        "zipf_s": 1.1,
+        "dense_median": CRITEO_DENSE_MEDIAN,
+        "dense_sigma": 1.5,
+        "dense_missing": CRITEO_DENSE_MISSING,
+        "sparse_missing": CRITEO_SPARSE_MISSING,
+    },
+}
+
+
+def _per_column(value, n):
+    # Scalars apply to every column; lists are cycled for wider layouts (e.g. 504 dense / 42 sparse)
+    if value is None or np.isscalar(value):
+        return [value] * n
+    return [value[i % len(value)] for i in range(n)]
+
+
+def get_profile(profile="uniform", num_dense=13, num_sparse=26, **overrides):
+    """Resolve a profile name (or dict) to per-column parameters.
+
+    overrides replace profile fields, e.g. ctr=0.1, zipf_s=1.3,
+    cardinalities=[...], or cardinality_scale=0.01 to shrink every cardinality.
+    """
+    params = dict(PROFILES[profile] if isinstance(profile, str) else profile)
+    scale = overrides.pop("cardinality_scale", None)
+    params.update(overrides)
+    resolved = {"ctr": params.get("ctr", 0.5), "realistic": "cardinalities" in params}
+    if resolved["realistic"]:
+        cardinalities = _per_column(params["cardinalities"], num_sparse)
+        if scale is not None:
+            cardinalities = [max(int(c * scale), 1) for c in cardinalities]
+        resolved["cardinalities"] = cardinalities
+        resolved["zipf_s"] = _per_column(params.get("zipf_s", 1.1), num_sparse)
+        resolved["dense_median"] = _per_column(params.get("dense_median", 1), num_dense)
+        resolved["dense_sigma"] = _per_column(params.get("dense_sigma", 1.5), num_dense)
+    resolved["dense_missing"] = _per_column(params.get("dense_missing", 0.0), num_dense)
+    resolved["sparse_missing"] = _per_column(params.get("sparse_missing", 0.0), num_sparse)
+    return resolved
+
+
+def zipf_ranks(rng, num_rows, cardinality, s):
+    """Ranks in [0, cardinality) with P(rank k) ~ (k + 1)^-s.
+
+    Inverse CDF of the continuous power law on [1, cardinality + 1), floored:
+    O(1) memory, so cardinalities in the hundreds of millions need no table.
+    """
+    u = rng.random(num_rows)
+    if abs(s - 1.0) < 1e-9:
+        x = np.power(cardinality + 1.0, u)
+    else:
+        x = np.power(1.0 + u * (np.power(cardinality + 1.0, 1.0 - s) - 1.0), 1.0 / (1.0 - s))
+    return np.minimum(x.astype(np.int64) - 1, cardinality - 1)
+
+
+def _missing_mask(rng, num_rows, rate):
+    return rng.random(num_rows) < rate if rate else None
+
+
+def criteo_schema(target_column="col_0", num_dense=13, num_sparse=26, sparse_type=pa.string()):
+    fields = [pa.field(target_column, pa.int64())]
+    fields += [pa.field(f"col_{i + 1}", pa.float32()) for i in range(num_dense)]
+    fields += [pa.field(f"col_{i + 1 + num_dense}", sparse_type) for i in range(num_sparse)]
+    return pa.schema(fields)
+
+
+def generate_row_group(rng, num_rows, target_column="col_0", num_dense=13, num_sparse=26, profile=None):
+    """One row group as a pyarrow table; no per-row Python work."""
+    profile = profile or get_profile("uniform", num_dense, num_sparse)
+    columns = [pa.array((rng.random(num_rows) < profile["ctr"]).astype(np.int64))]
+    for i in range(num_dense):
+        if profile["realistic"]:
+            median, sigma = profile["dense_median"][i], profile["dense_sigma"][i]
+            values = np.floor(rng.lognormal(np.log(median + 1.0), sigma, num_rows) - 1.0).clip(0).astype(np.float32)
+        else:
+            values = rng.random(num_rows, dtype=np.float32) * np.float32(2000) - np.float32(1000)
+        columns.append(pa.array(values, mask=_missing_mask(rng, num_rows, profile["dense_missing"][i])))
+    for i in range(num_sparse):
+        if profile["realistic"]:
+            ranks = zipf_ranks(rng, num_rows, profile["cardinalities"][i], profile["zipf_s"][i])
+            # Salt by column so equal ranks of different features get different keys
+            keys = hash64(ranks + (np.int64(i + 1) << np.int64(40))) & np.uint64(0xFFFFFFFF)
+        else:
+            keys = rng.integers(0, 1 << 32, size=num_rows, dtype=np.uint32)
+        columns.append(int_to_hex(keys, nulls=_missing_mask(rng, num_rows, profile["sparse_missing"][i])))
+    return pa.Table.from_arrays(columns, schema=criteo_schema(target_column, num_dense, num_sparse))
+
+
+def write_synthetic_parquet(sink, num_rows, target_column="col_0", num_dense=13, num_sparse=26,
+                            row_group_size=DEFAULT_ROW_GROUP_SIZE, seed=None, compression=None, profile="uniform"):
+    """Stream num_rows synthetic rows into a parquet file path or writable file object."""
+    rng = np.random.default_rng(seed)
+    if not isinstance(profile, dict) or "realistic" not in profile:
+        profile = get_profile(profile, num_dense, num_sparse)
+    schema = criteo_schema(target_column, num_dense, num_sparse)
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for start in range(0, num_rows, row_group_size):
+            rows = min(row_group_size, num_rows - start)
+            table = generate_row_group(rng, rows, target_column, num_dense, num_sparse, profile)
+            writer.write_table(table, row_group_size=rows)
+    return num_rows
+
+
+def generate_single_parquet(output_parquet, num_rows=4100000, target_column='col_0', num_dense=13, num_sparse=26,
+                            row_group_size=DEFAULT_ROW_GROUP_SIZE, seed=None, profile="uniform"):
+    """Drop-in replacement for the per-script generators: returns (success, path or error message)."""
+    try:
+        print(f"\nGenerating {output_parquet}...")
+        start_time = time.time()
+        write_synthetic_parquet(output_parquet, num_rows, target_column, num_dense, num_sparse,
+                                row_group_size, seed, profile=profile)
+        print(f"Finished writing to parquet file: {output_parquet} ({time.time() - start_time:.2f} seconds)")
+        return True, output_parquet
+    except Exception as e:
+        return False, f"Error processing {output_parquet}: {str(e)}"
+
+
+# ----------------------------------------
+# Deterministic, resumable shard generation
+#
+# Shard i is generated from SeedSequence([base_seed, i]) only, so any shard can
+# be regenerated on its own and yields the same rows. Local shards are written
+# to a temporary name and renamed when complete; remote shards (gs://, s3://)
+# are streamed with open_output, whose object only appears once the upload is
+# merged. A shard whose footer already holds rows_per_file rows is skipped, so
+# rerunning the same command resumes.
+# ----------------------------------------
+SHARD_NAME = "criteo_1TB_part_{:04d}.parquet"
+
+
+def shard_seed(base_seed, shard_index):
+    return np.random.SeedSequence([base_seed, shard_index])
+
+
+def shard_is_complete(path, num_rows):
+    """True if path (local or fsspec URL) is a readable parquet file whose footer holds num_rows rows."""
+    try:
+        if "://" not in path:
+            return pq.ParquetFile(path).metadata.num_rows == num_rows
+        import fsspec
+        with fsspec.open(path, "rb") as f:
+            return pq.ParquetFile(f).metadata.num_rows == num_rows
+    except Exception:
+        return False
+
+
+def generate_shard(output_path, shard_index, num_rows, base_seed=0, profile="uniform",
+                   row_group_size=DEFAULT_ROW_GROUP_SIZE, num_dense=13, num_sparse=26):
+    seed = shard_seed(base_seed, shard_index)
+    if "://" in output_path:
+        target = open_output(output_path)
+        try:
+            write_synthetic_parquet(target, num_rows, num_dense=num_dense, num_sparse=num_sparse,
+                                    row_group_size=row_group_size, seed=seed, profile=profile)
+            close_output(target)
+        except BaseException:
+            close_output(target, abort=True)
+            raise
+        return output_path
+    tmp_path = output_path + ".tmp"
+    write_synthetic_parquet(tmp_path, num_rows, num_dense=num_dense, num_sparse=num_sparse,
+                            row_group_size=row_group_size, seed=seed, profile=profile)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _generate_shard_task(args):
+    output_path, shard_index, kwargs = args
+    try:
+        return True, generate_shard(output_path, shard_index, **kwargs)
+    except Exception as e:
+        return False, f"Error processing {output_path}: {str(e)}"
+
+
+def generate_shards(output_dir, num_files, rows_per_file, base_seed=0, n_jobs=8, max_retries=3,
+                    profile="uniform", row_group_size=DEFAULT_ROW_GROUP_SIZE, num_dense=13, num_sparse=26):
+    """Generate every missing or incomplete shard; failed shards are retried up to max_retries times.
+
+    Returns the list of shard paths that still failed after the last retry.
+    """
+    if "://" not in output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    paths = [f"{output_dir.rstrip('/')}/{SHARD_NAME.format(i)}" for i in range(num_files)]
+    pending = [i for i, path in enumerate(paths) if not shard_is_complete(path, rows_per_file)]
+    print(f"{num_files - len(pending)}/{num_files} shards already complete, generating {len(pending)}")
+    kwargs = {"num_rows": rows_per_file, "base_seed": base_seed, "profile": profile,
+              "row_group_size": row_group_size, "num_dense": num_dense, "num_sparse": num_sparse}
+
+    start_time = time.time()
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        if attempt > 0:
+            print(f"Retrying {len(pending)} failed shards (attempt {attempt}/{max_retries})")
+        failed, finished = [], set()
+        try:
+            # A fresh pool per attempt: a pool with a dead worker cannot be reused
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = {executor.submit(_generate_shard_task, (paths[i], i, kwargs)): i for i in pending}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Generating shards"):
+                    success, result = future.result()
+                    finished.add(futures[future])
+                    if not success:
+                        print(f"\nFailed: {result}")
+                        failed.append(futures[future])
+        except BrokenProcessPool as e:
+            # A worker died mid-shard (OOM, signal): every shard not reported yet is retried
+            print(f"\nWorker pool broke ({e}), {len(pending) - len(finished)} unfinished shards will be retried")
+            failed += [i for i in pending if i not in finished and not shard_is_complete(paths[i], rows_per_file)]
+        pending = sorted(failed)
+
+    total_time = time.time() - start_time
+    print(f"Generation finished in {total_time / 3600:.2f} hours, {len(pending)} shards failed")
+    return [paths[i] for i in pending]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Criteo-shaped parquet dataset")
+    parser.add_argument("--output-dir", type=str, required=True, help="Folder (or gs:// / s3:// URL) for the parquet shards")
+    parser.add_argument("--num-files", type=int, default=1024, help="Number of shards")
+    parser.add_argument("--rows-per-file", type=int, default=4100000, help="Rows per shard")
+    parser.add_argument("--profile", type=str, default="uniform", choices=list(PROFILES), help="Value distributions")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed; shard i uses (seed, i)")
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE, help="Rows per row group")
+    parser.add_argument("--n-jobs", type=int, default=8, help="Shards generated in parallel")
+    parser.add_argument("--max-retries", type=int, default=3, help="Retries for failed shards")
+    args = parser.parse_args()
+
+    failed = generate_shards(args.output_dir, args.num_files, args.rows_per_file, args.seed, args.n_jobs,
+                             args.max_retries, args.profile, args.row_group_size)
+    if failed:
+        raise SystemExit(f"{len(failed)} shards failed: {failed}")
+
+if __name__ == "__main__":
+    main()
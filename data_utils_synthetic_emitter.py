@@ -0,0 +1,247 @@
+import os
+import time
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from data_utils_parquet_common import hex_to_int
+from data_utils_binary_container import ContainerWriter, DEFAULT_CHUNK_ROWS
+from data_utils_synthetic_criteo import DEFAULT_ROW_GROUP_SIZE, PROFILES, get_profile, generate_row_group
+from data_utils_streaming_upload import open_output, close_output
+
+# TensorFlow is optional: only needed for the tfrecord sink
+try:
+    import tensorflow as tf
+except ImportError:
+    tf = None
+
+# ----------------------------------------
+# One seeded synthetic row stream, written to several formats at once
+#
+# Every sink receives the same pyarrow row groups (label, dense..., sparse hex
+# strings), so cross-format read benchmarks compare identical content:
+#
+# parquet         as generated: hex-string sparse columns, nulls kept
+# parquet-int     sparse columns decoded to int64, nulls kept
+# tsv             Criteo raw text: label, dense, sparse tab-separated, missing = empty
+# binary-row      48 x uint32 per row as read by data_utils_binary_row.py:
+#                 [0] label, [1:14] dense, [16:42] sparse, rest zero; missing = 0
+#                 (data_utils_binary_row.py reads dense values as uint32 counts,
+#                 which the Criteo-shaped profiles are, so they are exact; the
+#                 "uniform" profile's floats in [-1000, 1000) are truncated and
+#                 clipped at 0 in this format only)
+# binary-column   binary column container (int64 label/sparse, float32 dense)
+# tfrecord        tf.train.Example per row; missing features are omitted
+#
+# parquet, tsv and binary-row also accept fsspec URLs (gs://, s3://, memory://)
+# and stream to them without a local copy (see data_utils_streaming_upload).
+# The default profile is "kaggle", so every format holds the same values.
+# ----------------------------------------
+DEFAULT_PROFILE = "kaggle"
+FORMATS = {
+    "parquet": ".parquet",
+    "parquet-int": "_int.parquet",
+    "tsv": ".tsv",
+    "binary-row": ".bin",
+    "binary-column": ".col",
+    "tfrecord": ".tfrecord",
+}
+BINARY_ROW_WIDTH = 48
+BINARY_ROW_DENSE = slice(1, 14)
+BINARY_ROW_SPARSE_START = 16
+
+
+def _split_columns(table):
+    names = table.column_names
+    dense = [name for name in names[1:] if pa.types.is_floating(table.schema.field(name).type)]
+    sparse = [name for name in names[1:] if name not in dense]
+    return names[0], dense, sparse
+
+
+def _open_stream(path):
+    target = open_output(path)
+    return open(target, "wb") if isinstance(target, str) else target
+
+
+def _null_mask(array):
+    return np.asarray(array.is_null()) if array.null_count else None
+
+
+class ParquetSink:
+    def __init__(self, path, schema, sparse_as_int=False, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        self.sparse_as_int = sparse_as_int
+        self.row_group_size = row_group_size
+        if sparse_as_int:
+            schema = pa.schema([pa.field(f.name, pa.int64()) if pa.types.is_string(f.type) else f for f in schema])
+        self.target = open_output(path)
+        self.writer = pq.ParquetWriter(self.target, schema, compression=None)
+
+    def write(self, table):
+        if self.sparse_as_int:
+            _, _, sparse = _split_columns(table)
+            for name in sparse:
+                array = table.column(name)
+                values = pa.array(hex_to_int(array).astype(np.int64), mask=_null_mask(array))
+                table = table.set_column(table.schema.get_field_index(name), name, values)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+
+    def close(self):
+        self.writer.close()
+        close_output(self.target)
+
+
+class TsvSink:
+    def __init__(self, path, schema):
+        self.file = _open_stream(path)
+        self.options = pacsv.WriteOptions(include_header=False, delimiter="\t", quoting_style="none")
+
+    def write(self, table):
+        pacsv.write_csv(table, self.file, self.options)
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryRowSink:
+    def __init__(self, path, schema):
+        self.file = _open_stream(path)
+
+    def write(self, table):
+        label, dense, sparse = _split_columns(table)
+        rows = np.zeros((table.num_rows, BINARY_ROW_WIDTH), dtype="<u4")
+        rows[:, 0] = table.column(label).fill_null(0).to_numpy()
+        for j, name in enumerate(dense):
+            values = table.column(name).fill_null(0).to_numpy()
+            rows[:, BINARY_ROW_DENSE.start + j] = np.clip(values, 0, 0xFFFFFFFF).astype(np.uint32)
+        for j, name in enumerate(sparse):
+            rows[:, BINARY_ROW_SPARSE_START + j] = hex_to_int(table.column(name)).astype(np.uint32)
+        self.file.write(rows.data)
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnStoreSink:
+    def __init__(self, path, schema, num_rows, chunk_rows=DEFAULT_CHUNK_ROWS):
+        columns = [(f.name, np.float32 if pa.types.is_floating(f.type) else np.int64) for f in schema]
+        self.writer = ContainerWriter(path, num_rows, columns, chunk_rows)
+
+    def write(self, table):
+        label, dense, sparse = _split_columns(table)
+        for name in table.column_names:
+            array = table.column(name)
+            if name in sparse:
+                values = hex_to_int(array).astype(np.int64)
+            else:
+                values = array.fill_null(0).to_numpy()
+            self.writer.write(name, values, _null_mask(array))
+
+    def close(self):
+        self.writer.close()
+
+
+class TFRecordSink:
+    def __init__(self, path, schema):
+        if tf is None:
+            raise ImportError("tfrecord sink requires tensorflow")
+        self.writer = tf.io.TFRecordWriter(path)
+
+    def write(self, table):
+        columns = {name: table.column(name).to_pylist() for name in table.column_names}
+        label, dense, sparse = _split_columns(table)
+        for i in range(table.num_rows):
+            feature = {label: tf.train.Feature(int64_list=tf.train.Int64List(value=[columns[label][i]]))}
+            for name in dense:
+                if columns[name][i] is not None:
+                    feature[name] = tf.train.Feature(float_list=tf.train.FloatList(value=[columns[name][i]]))
+            for name in sparse:
+                if columns[name][i] is not None:
+                    feature[name] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[columns[name][i].encode()]))
+            example = tf.train.Example(features=tf.train.Features(feature=feature))
+            self.writer.write(example.SerializeToString())
+
+    def close(self):
+        self.writer.close()
+
+
+def open_sinks(output_prefix, formats, schema, num_rows, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+               chunk_rows=DEFAULT_CHUNK_ROWS):
+    """{format: sink} writing to output_prefix + the format's suffix."""
+    sinks = {}
+    try:
+        for fmt in formats:
+            path = output_prefix + FORMATS[fmt]
+            if fmt in ("parquet", "parquet-int"):
+                sinks[fmt] = ParquetSink(path, schema, fmt == "parquet-int", row_group_size)
+            elif fmt == "tsv":
+                sinks[fmt] = TsvSink(path, schema)
+            elif fmt == "binary-row":
+                sinks[fmt] = BinaryRowSink(path, schema)
+            elif fmt == "binary-column":
+                sinks[fmt] = ColumnStoreSink(path, schema, num_rows, chunk_rows)
+            elif fmt == "tfrecord":
+                sinks[fmt] = TFRecordSink(path, schema)
+    except Exception:
+        for sink in sinks.values():
+            sink.close()
+        raise
+    return sinks
+
+
+def emit(output_prefix, formats, num_rows, seed=0, profile=DEFAULT_PROFILE, num_dense=13, num_sparse=26,
+         row_group_size=DEFAULT_ROW_GROUP_SIZE, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Generate num_rows rows once and write every row group to all requested formats."""
+    rng = np.random.default_rng(seed)
+    profile = get_profile(profile, num_dense, num_sparse)
+    first = generate_row_group(rng, min(row_group_size, num_rows), num_dense=num_dense,
+                               num_sparse=num_sparse, profile=profile)
+    sinks = open_sinks(output_prefix, formats, first.schema, num_rows, row_group_size, chunk_rows)
+    try:
+        table, written = first, 0
+        while True:
+            for sink in sinks.values():
+                sink.write(table)
+            written += table.num_rows
+            if written >= num_rows:
+                break
+            table = generate_row_group(rng, min(row_group_size, num_rows - written), num_dense=num_dense,
+                                       num_sparse=num_sparse, profile=profile)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    return {fmt: output_prefix + FORMATS[fmt] for fmt in formats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write one synthetic Criteo row stream to several formats")
+    parser.add_argument("--output-prefix", type=str, required=True, help="Output path without suffix")
+    parser.add_argument("--formats", type=str, default="parquet,tsv,binary-row,binary-column",
+                        help=f"Comma-separated subset of {','.join(FORMATS)}")
+    parser.add_argument("--num-rows", type=int, default=4100000, help="Rows to generate")
+    parser.add_argument("--profile", type=str, default=DEFAULT_PROFILE, choices=list(PROFILES),
+                        help="Value distributions (binary-row truncates 'uniform' dense floats)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the row stream")
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE, help="Rows generated per batch")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per binary column chunk")
+    args = parser.parse_args()
+
+    formats = args.formats.split(",")
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        parser.error(f"Unknown formats: {unknown}")
+    remote = "://" in args.output_prefix
+    if not remote:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output_prefix)), exist_ok=True)
+
+    start_time = time.time()
+    paths = emit(args.output_prefix, formats, args.num_rows, args.seed, args.profile,
+                 row_group_size=args.row_group_size, chunk_rows=args.chunk_rows)
+    total_time = time.time() - start_time
+    for fmt, path in paths.items():
+        print(f"{fmt:14s} {path}" + ("" if remote else f" ({os.path.getsize(path) / 1024**2:.1f} MB)"))
+    print(f"Wrote {args.num_rows:,} rows to {len(paths)} formats in {total_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import json
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+ARTIFACT_VERSION = 1
+
+# Modulus-bounded vocabularies up to this size can be expanded into a direct lookup table
+MAX_LUT_SIZE = 1 << 26
+
+
+# ----------------------------------------
+# Binary vocabulary artifact
+#
+# <vocab_dir>/manifest.json      column -> file, dtype, size, modulus, ordering,
+#                                and optional min_count / top_k / oov_id
+# <vocab_dir>/<col>.npy          sorted unique keys
+# <vocab_dir>/<col>_ids.npy      IDs aligned with the sorted keys (only for
+#                                ordering="first_occurrence" / "incremental";
+#                                for "sorted" the ID is the position in the key
+#                                array)
+# The manifest also lists the input files the vocabulary covers.
+#
+# With generation=n the arrays go to <vocab_dir>/v<n>/ instead. File paths in
+# the manifest are relative to vocab_dir, and the manifest is replaced
+# atomically, so it is the single pointer to the current generation: readers
+# see either the old or the new vocabulary, never a mix.
+# ----------------------------------------
+def generation_dir(generation):
+    return f"v{generation:04d}"
+
+
+def save_vocab_artifact(vocab_dir, vocabs, modulus=None, ordering="sorted",
+                        oov_bucket=False, min_count=None, top_k=None, files=None, generation=None):
+    """Write per-column vocabularies.
+
+    vocabs maps column -> keys. For ordering="sorted" the keys must be sorted and
+    unique; for "first_occurrence" / "incremental" keys are indexed by ID. With
+    oov_bucket=True, ID == size is reserved for values missing from the vocab.
+    """
+    prefix = generation_dir(generation) if generation is not None else ""
+    os.makedirs(os.path.join(vocab_dir, prefix), exist_ok=True)
+    manifest = {"version": ARTIFACT_VERSION, "columns": {}}
+    if generation is not None:
+        manifest["generation"] = generation
+    if files is not None:
+        manifest["files"] = sorted(os.path.basename(f) for f in files)
+    for col, keys in vocabs.items():
+        keys = np.asarray(keys, dtype=np.int64)
+        entry = {
+            "file": os.path.join(prefix, f"{col}.npy"),
+            "dtype": keys.dtype.str,
+            "size": int(len(keys)),
+            "modulus": modulus,
+            "ordering": ordering,
+        }
+        if oov_bucket:
+            entry["oov_id"] = int(len(keys))
+        if min_count is not None and min_count > 1:
+            entry["min_count"] = min_count
+        if top_k is not None:
+            entry["top_k"] = top_k
+        if ordering in ("first_occurrence", "incremental"):
+            order = np.argsort(keys, kind="stable")
+            entry["ids_file"] = os.path.join(prefix, f"{col}_ids.npy")
+            np.save(os.path.join(vocab_dir, entry["file"]), keys[order])
+            np.save(os.path.join(vocab_dir, entry["ids_file"]), order.astype(np.int64))
+        elif ordering == "sorted":
+            np.save(os.path.join(vocab_dir, entry["file"]), keys)
+        else:
+            raise ValueError(f"Unknown vocab ordering: {ordering}")
+        manifest["columns"][col] = entry
+    # Arrays first, then the manifest in one rename
+    tmp_path = os.path.join(vocab_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(vocab_dir, MANIFEST_FILE))
+    return manifest
+
+
+class VocabColumn:
+    """Memory-mapped vocabulary for one column with vectorized lookups."""
+
+    def __init__(self, vocab_dir, col, entry):
+        self.column = col
+        self.size = entry["size"]
+        self.modulus = entry["modulus"]
+        self.ordering = entry["ordering"]
+        self.oov_id = entry.get("oov_id")
+        # Empty arrays cannot be memory-mapped
+        mmap_mode = "r" if self.size > 0 else None
+        self.keys = np.load(os.path.join(vocab_dir, entry["file"]), mmap_mode=mmap_mode)
+        self.ids = np.load(os.path.join(vocab_dir, entry["ids_file"]), mmap_mode=mmap_mode) if "ids_file" in entry else None
+        self._lut = None
+
+    def lut(self):
+        """Direct key -> ID table over [0, modulus), built on first use."""
+        if self._lut is None:
+            self._lut = np.full(self.modulus, -1, dtype=np.int64)
+            self._lut[self.keys] = self.ids if self.ids is not None else np.arange(self.size, dtype=np.int64)
+        return self._lut
+
+    def lookup(self, values, default=-1, use_lut=False):
+        """Map int64 keys to IDs; keys missing from the vocabulary map to default."""
+        values = np.asarray(values, dtype=np.int64)
+        if use_lut and self.modulus is not None and self.modulus <= MAX_LUT_SIZE:
+            ids = self.lut()[values]
+            return ids if default == -1 else np.where(ids < 0, default, ids)
+        if self.size == 0:
+            return np.full(len(values), default, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.keys, values), self.size - 1)
+        ids = pos if self.ids is None else np.asarray(self.ids[pos])
+        return np.where(self.keys[pos] == values, ids, default)
+
+    def keys_by_id(self):
+        """Keys indexed by ID (the inverse mapping)."""
+        if self.ids is None:
+            return np.asarray(self.keys)
+        out = np.empty(self.size, dtype=np.int64)
+        out[self.ids] = self.keys
+        return out
+
+
+def load_manifest(vocab_dir):
+    with open(os.path.join(vocab_dir, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def load_vocab_artifact(vocab_dir, columns=None):
+    """O(1) load: only the manifest is parsed, key arrays are memory-mapped."""
+    manifest = load_manifest(vocab_dir)
+    return {col: VocabColumn(vocab_dir, col, entry)
+            for col, entry in manifest["columns"].items()
+            if columns is None or col in columns}
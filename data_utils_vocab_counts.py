@@ -0,0 +1,57 @@
+import numpy as np
+
+# Modulus-bounded domains up to this size are counted with np.bincount
+MAX_BINCOUNT_SIZE = 1 << 27
+
+
+# ----------------------------------------
+# Partial counts
+#
+# dense:  1-D int64 array of length modulus, counts[key]
+# sparse: 2 x n int64 array, row 0 sorted keys, row 1 counts
+# Both are plain ndarrays so they can be spilled with np.save.
+# ----------------------------------------
+def count_values(values, modulus=None):
+    values = np.asarray(values, dtype=np.int64)
+    if modulus is not None and modulus <= MAX_BINCOUNT_SIZE:
+        return np.bincount(values, minlength=modulus).astype(np.int64)
+    keys, counts = np.unique(values, return_counts=True)
+    return np.stack([keys, counts.astype(np.int64)])
+
+
+def _as_sparse(counts):
+    if counts.ndim == 2:
+        return counts
+    keys = np.flatnonzero(counts)
+    return np.stack([keys.astype(np.int64), counts[keys]])
+
+
+def merge_counts(left, right):
+    """Sum two partial counts (dense + dense stays dense, anything else is sparse)."""
+    if left.ndim == 1 and right.ndim == 1:
+        return left + right
+    left, right = _as_sparse(left), _as_sparse(right)
+    keys = np.concatenate([left[0], right[0]])
+    counts = np.concatenate([left[1], right[1]])
+    if len(keys) == 0:
+        return np.zeros((2, 0), dtype=np.int64)
+    # Sorted-run reduction: equal keys become adjacent after a stable sort
+    order = np.argsort(keys, kind="stable")
+    keys, counts = keys[order], counts[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return np.stack([keys[starts], np.add.reduceat(counts, starts)])
+
+
+def select_vocab(counts, min_count=1, top_k=None):
+    """Sorted keys that survive the frequency thresholds.
+
+    top_k keeps the most frequent keys; ties are broken by the smaller key so the
+    result is deterministic.
+    """
+    keys, freq = _as_sparse(counts)
+    keep = freq >= max(min_count, 1)
+    keys, freq = keys[keep], freq[keep]
+    if top_k is not None and len(keys) > top_k:
+        order = np.lexsort((keys, -freq))[:top_k]
+        keys = keys[order]
+    return np.sort(keys)
@@ -35,6 +35,8 @@ import logging
 import cudf
 import pandas as pd
 
+from data_utils_parquet_cardinality_sketch import load_cardinality_estimates, suggest_part_size
+
 # Set up logging
 logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -248,7 +250,7 @@ def main():
     parser.add_argument('--file_pattern', type=str, default="*.parquet", 
                       help="Pattern to match training parquet files")
     parser.add_argument('--part_size', type=str, default="1GB", 
-                      help="Size of each data partition in GB")
+                      help="Size of each data partition in GB, or 'auto' to size it from the cardinality sketch in data_dir (local or gs://)")
     parser.add_argument('--vocab_size', type=int, default=8192, 
                       help="Vocabulary size for categorical features")
     args = parser.parse_args()
@@ -267,8 +269,22 @@ def main():
             logging.info(f"First file: {train_paths[0]}")
             logging.info(f"Last file: {train_paths[-1]}")
 
+        # Size partitions from the cardinality sketch so the vocab tables still fit on device
+        part_size = args.part_size
+        if part_size == "auto":
+            # Read through fsspec for gs:// data dirs
+            sketch = load_cardinality_estimates(args.data_dir)
+            if sketch is not None:
+                part_size = suggest_part_size(sketch, device_mem_size(kind="total"))
+                logging.info(f"Cardinality sketch: {sum(sketch['estimates'].values()):,} estimated uniques")
+            else:
+                part_size = "1GB"
+                logging.warning(f"--part_size auto: no cardinality sketch in {args.data_dir} "
+                                f"(run data_utils_parquet_cardinality_sketch.py first), using {part_size}")
+            logging.info(f"Auto part size: {part_size}")
+
         # Preprocess data
-        preprocess_data(train_paths, client, args.vocab_size, args.part_size)
+        preprocess_data(train_paths, client, args.vocab_size, part_size)
 
     finally:
         # Cleanup
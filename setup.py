@@ -30,8 +30,10 @@ if __name__ == "__main__":
         "tensorflow==2.15",
         "tensorflow-metadata==1.15.0",
         "tfx-bsl==1.15.1",
-        "apache-beam[gcp]==2.47.0",
-        "pyarrow==10.0.0"
+        "apache-beam[gcp]==2.64.0",
+        "pyarrow==10.0.1"
       ],
     packages=setuptools.find_packages(),
+    # Shared by the pipelines, imported on the workers
+    py_modules=["apache_beam_batched_dofns", "data_utils_parquet_common"],
   )
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_utils_parquet_vocab_fused import fused_categorify, save_first_occurrence_vocabs
+from data_utils_parquet_vocab_1TB_no import collect_unique_values
+from data_utils_parquet_vocab_incremental import extend_vocab_artifact
+from data_utils_vocab_artifact import load_vocab_artifact
+
+COLUMNS = ["col_14", "col_15"]
+MODULUS = 1 << 20
+
+
+def write_null_bearing_files(data_dir, num_files=3, num_rows=2000, seed=0):
+    """Hex sparse columns with ~30% nulls and no real key 0."""
+    rng = np.random.default_rng(seed)
+    files = []
+    for i in range(num_files):
+        columns = {"col_0": rng.integers(0, 2, num_rows)}
+        for col in COLUMNS:
+            keys = rng.integers(1, 500, num_rows)
+            columns[col] = pa.array([format(k, "x") for k in keys], mask=rng.random(num_rows) < 0.3)
+        path = os.path.join(data_dir, f"part_{i:04d}.parquet")
+        pq.write_table(pa.table(columns), path, row_group_size=700)
+        files.append(path)
+    return files
+
+
+def test_fused_nulls_map_to_minus_one():
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_null_bearing_files(tmp)
+        vocabs = fused_categorify(files, os.path.join(tmp, "out"), COLUMNS, MODULUS, n_threads=2)
+        uniques = collect_unique_values(files, COLUMNS, MODULUS, n_jobs=1)
+        for file in files:
+            raw = pq.read_table(file)
+            out = pq.read_table(os.path.join(tmp, "out", os.path.basename(file)))
+            for col in COLUMNS:
+                nulls = np.asarray(raw.column(col).is_null())
+                ids = np.asarray(out.column(col))
+                assert (ids[nulls] == -1).all()
+                assert (ids[~nulls] >= 0).all()
+        for col in COLUMNS:
+            # Same keys as the two-pass builder: no phantom key 0 for the missing values
+            assert 0 not in vocabs[col].keys()
+            assert np.array_equal(np.sort(vocabs[col].keys()), uniques[col])
+
+
+def test_fused_artifact_extends_like_the_other_builders():
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_null_bearing_files(tmp, num_files=4)
+        vocab_dir = os.path.join(tmp, "vocab")
+        vocabs = fused_categorify(files[:3], os.path.join(tmp, "out"), COLUMNS, MODULUS, n_threads=2)
+        save_first_occurrence_vocabs(vocabs, vocab_dir, MODULUS, files=files[:3])
+        extend_vocab_artifact(vocab_dir, files[3:], n_jobs=1)
+        uniques = collect_unique_values(files, COLUMNS, MODULUS, n_jobs=1)
+        for col, vocab in load_vocab_artifact(vocab_dir).items():
+            assert np.array_equal(np.sort(vocab.keys_by_id()), uniques[col])
+
+
+if __name__ == "__main__":
+    test_fused_nulls_map_to_minus_one()
+    test_fused_artifact_extends_like_the_other_builders()
+    print("✅ Fused vocab null handling matches the two-pass builder")